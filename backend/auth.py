@@ -1,13 +1,19 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 from database import get_db
 from models import User
 from schemas import TokenData
+from cache import TTLCache
+from passwords import (
+    password_pool, PasswordPoolBusy,
+    hash_password, verify_password as _verify_password, needs_rehash
+)
 import os
 
 # Configuration
@@ -18,30 +24,97 @@ SECRET_KEY = os.getenv("SECRET_KEY", "a-very-secret-key-for-testing-only")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Authenticated principals keyed by token subject, so most requests skip the users SELECT
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+user_cache = TTLCache(ttl=AUTH_CACHE_TTL, maxsize=AUTH_CACHE_SIZE)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return _verify_password(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password."""
-    return pwd_context.hash(password)
+    return hash_password(password)
+
+async def _run_password_job(func, *args):
+    """Run a password job in the worker pool, mapping saturation to a 503."""
+    try:
+        return await password_pool.run(func, *args)
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"},
+        )
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password in the password worker pool."""
+    return await _run_password_job(_verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password in the password worker pool."""
+    return await _run_password_job(hash_password, password)
+
+async def rehash_password(user_id: int, password: str) -> None:
+    """Upgrade a user's stored hash to the current cost factor.
+
+    Meant to run as a background task after a successful login, so it uses
+    its own session and never fails the request.
+    """
+    from database import SessionLocal
+
+    try:
+        new_hash = await password_pool.run(hash_password, password)
+    except PasswordPoolBusy:
+        return
+
+    def save():
+        db = SessionLocal()
+        try:
+            user = db.get(User, user_id)
+            if user is not None and needs_rehash(user.password_hash):
+                user.password_hash = new_hash
+                db.commit()
+        finally:
+            db.close()
+
+    await run_in_threadpool(save)
 
 def get_user(db: Session, username: str) -> Optional[User]:
     """Get user by username."""
     return db.query(User).filter(User.username == username).first()
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+def _user_snapshot(user: User) -> dict:
+    """Copy a user's column values so they can be cached outside any session."""
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+def _user_from_snapshot(db: Session, snapshot: dict) -> User:
+    """Rebuild a cached user and attach it to db as persistent, without a SELECT."""
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    db.add(user)
+    return user
+
+def invalidate_cached_user(username: str) -> None:
+    """Forget a cached principal so the next request reloads it."""
+    user_cache.delete("users", username)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target):
+    """Drop a user from the auth cache whenever the row changes (e.g. is_active/is_admin)."""
+    invalidate_cached_user(target.username)
+
+async def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
     """Authenticate a user with username and password."""
-    user = get_user(db, username)
+    user = await run_in_threadpool(get_user, db, username)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
     return user
 
@@ -56,8 +129,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Get the current authenticated user."""
+def get_user_from_token(token: str, db: Session) -> User:
+    """Resolve a JWT to its user, raising a 401 HTTPException if it isn't valid."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,15 +141,34 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
+        token_data = TokenData(username=username, user_id=payload.get("uid"))
     except JWTError:
         raise credentials_exception
     
-    user = get_user(db, username=token_data.username)
+    snapshot = user_cache.get("users", token_data.username)
+    if snapshot is not None:
+        return _user_from_snapshot(db, snapshot)
+    
+    # Newer tokens carry the user id, so a cache miss is a primary-key lookup
+    if token_data.user_id is not None:
+        user = db.get(User, token_data.user_id)
+        if user is not None and user.username != token_data.username:
+            user = None
+    else:
+        user = get_user(db, username=token_data.username)
     if user is None:
         raise credentials_exception
+    user_cache.set("users", token_data.username, _user_snapshot(user))
     return user
 
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Get the current authenticated user.
+
+    A cache miss queries the database synchronously, so the lookup runs in
+    the threadpool rather than on the event loop.
+    """
+    return await run_in_threadpool(get_user_from_token, token, db)
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     """Get the current active user."""
     if not current_user.is_active:
@@ -89,9 +181,10 @@ async def get_current_admin_user(current_user: User = Depends(get_current_active
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
-def create_user(db: Session, user_data: dict) -> User:
-    """Create a new user."""
-    hashed_password = get_password_hash(user_data["password"])
+def create_user(db: Session, user_data: dict, hashed_password: Optional[str] = None) -> User:
+    """Create a new user, hashing the password here unless a hash is given."""
+    if hashed_password is None:
+        hashed_password = get_password_hash(user_data["password"])
     db_user = User(
         username=user_data["username"],
         email=user_data["email"],
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /food-posts served sync (threadpool) vs async (AsyncSession.run_sync).
+
+Both variants run the same list_food_posts query against the configured
+database and return the same JSON; only the session differs. The sync one is
+the endpoint as it was before, a def using get_db, so Starlette runs it on its
+threadpool (40 threads by default). The async one is main.get_food_posts.
+Requests are sent in process through httpx's ASGI transport, with a fixed
+number in flight:
+    python bench_async.py
+    python bench_async.py --requests 2000 --concurrency 200 --limit 50
+
+Point DATABASE_URL at MySQL for numbers that include network round trips;
+against a local SQLite file queries never wait on I/O, so the async path has
+little to win there.
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+from typing import List
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy.orm import Session
+from database import get_db
+from main import get_food_posts, list_food_posts
+from schemas import FoodPostListResponse, FoodPostSearch
+from serialization import json_response
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sync/food-posts")
+    def sync_food_posts(search: FoodPostSearch = Depends(), db: Session = Depends(get_db)):
+        result, next_cursor = list_food_posts(db, search)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return json_response(FoodPostListResponse, result, headers)
+
+    app.add_api_route("/async/food-posts", get_food_posts, methods=["GET"])
+    return app
+
+async def run(client: httpx.AsyncClient, path: str, requests: int, concurrency: int) -> dict:
+    """Send requests GETs to path with concurrency in flight; return throughput and latency."""
+    latencies: List[float] = []
+    queue = iter(range(requests))
+
+    async def worker():
+        for _ in queue:
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare sync and async /food-posts under concurrent requests.")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per variant (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=100, help="requests in flight (default: 100)")
+    parser.add_argument("--limit", type=int, default=20, help="page size (default: 20)")
+    args = parser.parse_args()
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        query = f"?limit={args.limit}"
+        sync_body = (await client.get(f"/sync/food-posts{query}")).content
+        async_body = (await client.get(f"/async/food-posts{query}")).content
+        assert sync_body == async_body, "variants return different JSON"
+
+        # Warm up both pools before timing
+        await run(client, f"/sync/food-posts{query}", args.concurrency, args.concurrency)
+        await run(client, f"/async/food-posts{query}", args.concurrency, args.concurrency)
+
+        print(f"📦 {args.requests} requests, {args.concurrency} in flight, {args.limit} posts per page ({len(sync_body)} bytes)")
+        for label, path in (("sync def + threadpool", "/sync"), ("async def + run_sync ", "/async")):
+            stats = await run(client, f"{path}/food-posts{query}", args.requests, args.concurrency)
+            print(f"{label}: {stats['rps']:8.1f} req/s  p50 {stats['p50_ms']:7.1f} ms  p95 {stats['p95_ms']:7.1f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-row cost of serializing a /food-posts page.
+
+Compares the old ORM path (copy each post's __dict__, validate a
+FoodPostListResponse from it, then let FastAPI validate and serialize the
+list against response_model) with the column-row path in serialization.py.
+No database is involved; both paths start from rows already fetched.
+    python bench_serialization.py
+    python bench_serialization.py --rows 100 --repeat 200
+"""
+
+import time
+import asyncio
+import argparse
+from datetime import date, datetime
+from typing import List
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from models import Category, FoodImage, FoodPost, User
+from schemas import CategoryResponse, FoodImageResponse, FoodPostListResponse, UserResponse
+from serialization import construct, json_response
+
+def sample_data(rows: int):
+    """Build the same page twice: as ORM objects and as column rows."""
+    now = datetime.utcnow()
+    user = User(id=1, username="baker", email="baker@example.com", full_name="Bread Baker", city="Oslo", is_active=True, created_at=now)
+    category = Category(id=1, name="Bakery", description="Bread and pastries", icon="🥖", created_at=now)
+
+    posts, images, mappings, image_rows = [], {}, [], {}
+    for i in range(1, rows + 1):
+        posts.append(FoodPost(
+            id=i, title=f"Sourdough loaf {i}", description="Baked this morning", quantity="2 loaves",
+            expiry_date=date(2030, 1, 1), pickup_location="Main St 1", is_available=True, is_claimed=False,
+            latitude=59.91, longitude=10.75, created_at=now, user=user, category=category
+        ))
+        key = f"uploads/{i:064x}"
+        images[i] = FoodImage(id=i, food_post_id=i, image_path=f"{key}_full.webp", card_path=f"{key}_card.webp",
+                              thumb_path=f"{key}_thumb.webp", is_primary=True, created_at=now)
+
+        mapping = {name: getattr(posts[-1], name) for name in FoodPostListResponse.model_fields if name in FoodPost.__table__.columns}
+        mapping.update({f"user_{name}": getattr(user, name) for name in UserResponse.model_fields})
+        mapping.update({f"category_{name}": getattr(category, name) for name in CategoryResponse.model_fields})
+        mappings.append(mapping)
+        image_rows[i] = {name: getattr(images[i], name) for name in FoodImageResponse.model_fields}
+    return posts, images, mappings, image_rows
+
+def orm_path(posts, images, response_field, loop) -> bytes:
+    result = []
+    for post in posts:
+        post_dict = post.__dict__.copy()
+        post_dict["primary_image"] = images.get(post.id)
+        result.append(FoodPostListResponse(**post_dict))
+    # What FastAPI does with an async endpoint's return value and its response_model
+    return loop.run_until_complete(serialize_response(field=response_field, response_content=result, dump_json=True))
+
+def row_path(mappings, image_rows) -> bytes:
+    result = []
+    for row in mappings:
+        image = image_rows.get(row["id"])
+        result.append(construct(
+            FoodPostListResponse, row,
+            user=construct(UserResponse, row, "user_"),
+            category=construct(CategoryResponse, row, "category_") if row["category_id"] is not None else None,
+            primary_image=construct(FoodImageResponse, image) if image is not None else None,
+            distance_km=None
+        ))
+    return json_response(FoodPostListResponse, result).body
+
+def time_per_row(func, repeat: int, rows: int) -> float:
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / (repeat * rows) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row serialization cost of the feed.")
+    parser.add_argument("--rows", type=int, default=20, help="posts per page (default: 20)")
+    parser.add_argument("--repeat", type=int, default=500, help="pages serialized per path (default: 500)")
+    args = parser.parse_args()
+
+    posts, images, mappings, image_rows = sample_data(args.rows)
+    response_field = create_model_field(name="Response_get_food_posts", type_=List[FoodPostListResponse], mode="serialization")
+
+    loop = asyncio.new_event_loop()
+
+    orm_body = orm_path(posts, images, response_field, loop)
+    row_body = row_path(mappings, image_rows)
+    assert orm_body == row_body, "paths produce different JSON"
+
+    orm_us = time_per_row(lambda: orm_path(posts, images, response_field, loop), args.repeat, args.rows)
+    row_us = time_per_row(lambda: row_path(mappings, image_rows), args.repeat, args.rows)
+    print(f"📦 {args.rows} rows x {args.repeat} pages, identical JSON ({len(row_body)} bytes per page)")
+    print(f"ORM objects + response_model validation: {orm_us:8.2f} µs/row")
+    print(f"Column rows + model_construct:           {row_us:8.2f} µs/row ({orm_us / row_us:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
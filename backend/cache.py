@@ -0,0 +1,131 @@
+"""
+In-process caching for read-mostly data.
+
+TTLCache is a thread-safe LRU cache whose entries also expire after a fixed
+time. Keys live in namespaces with a version number, so bumping a namespace's
+version invalidates all of its entries without scanning the cache.
+
+The cache is per process: with several workers, an invalidation only reaches
+the worker that made the change, and the others catch up when their entries
+expire.
+"""
+
+import os
+import json
+import time
+import inspect
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+
+_MISSING = object()
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and versioned namespaces."""
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, namespace: str, key: Hashable) -> Tuple:
+        return (namespace, self._versions.get(namespace, 0), key)
+
+    def version(self, namespace: str) -> int:
+        """Current version of a namespace, to pass to set() after a slow load."""
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def get(self, namespace: str, key: Hashable = None, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired."""
+        with self._lock:
+            cache_key = self._key(namespace, key)
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[cache_key]
+                return default
+            self._entries.move_to_end(cache_key)
+            return value
+
+    def set(self, namespace: str, key: Hashable, value: Any, version: Optional[int] = None) -> None:
+        """Store a value, evicting the least recently used entry if full.
+
+        With version (from version() before the value was loaded), the value
+        is dropped if the namespace was invalidated since, as it may be stale.
+        """
+        with self._lock:
+            if version is not None and version != self._versions.get(namespace, 0):
+                return
+            cache_key = self._key(namespace, key)
+            self._entries[cache_key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, namespace: str, key: Hashable = None) -> None:
+        """Drop a single entry."""
+        with self._lock:
+            self._entries.pop(self._key(namespace, key), None)
+
+    def invalidate(self, namespace: str) -> None:
+        """Invalidate every entry in a namespace by bumping its version."""
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            stale = [k for k in self._entries if k[0] == namespace]
+            for cache_key in stale:
+                del self._entries[cache_key]
+
+    def get_or_load(self, namespace: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value, calling loader() to fill the cache on a miss."""
+        version = self.version(namespace)
+        value = self.get(namespace, key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(namespace, key, value, version)
+        return value
+
+# Shared cache for near-static lookups such as categories
+reference_cache = TTLCache(ttl=REFERENCE_CACHE_TTL, maxsize=256)
+
+async def cached_json_response(
+    request: Request,
+    cache: TTLCache,
+    namespace: str,
+    loader: Callable[[], Any],
+    key: Hashable = None,
+    max_age: int = 0
+) -> Response:
+    """Serve loader()'s result as JSON from cache with an ETag.
+
+    loader may return the data or an awaitable of it. The body is serialized
+    once per cache fill. Clients that send a matching If-None-Match get an
+    empty 304 instead of the body.
+    """
+    version = cache.version(namespace)
+    cached = cache.get(namespace, key)
+    if cached is None:
+        data = loader()
+        if inspect.isawaitable(data):
+            data = await data
+        body = json.dumps(jsonable_encoder(data), ensure_ascii=False).encode("utf-8")
+        cached = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+        cache.set(namespace, key, cached, version)
+
+    body, etag = cached
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, must-revalidate",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
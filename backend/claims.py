@@ -0,0 +1,190 @@
+"""
+Claiming food posts, with a time limit and a first-come, first-served waitlist.
+
+A claim lasts CLAIM_TTL_MINUTES. When it is released, or runs out before the
+post is marked as picked up, the post goes straight to the first person on
+its waitlist instead of back to whoever polls fastest.
+
+Every state change is a conditional UPDATE whose row count says whether it
+won, so concurrent claimers, releases and expiry never wait on row locks.
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import ClaimWaitlist, FoodPost
+
+logger = logging.getLogger(__name__)
+
+CLAIM_TTL_MINUTES = int(os.getenv("CLAIM_TTL_MINUTES", "120"))
+
+def claim_post(db: Session, post_id: int, user_id: int) -> Optional[datetime]:
+    """Claim an open post for user_id unless they own it. Does not commit.
+
+    Returns when the claim expires, or None if the post could not be claimed.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(minutes=CLAIM_TTL_MINUTES)
+    claimed = db.execute(
+        update(FoodPost)
+        .where(
+            FoodPost.id == post_id,
+            FoodPost.is_available == True,
+            FoodPost.is_claimed == False,
+            FoodPost.user_id != user_id
+        )
+        .values(
+            is_claimed=True,
+            claimed_by=user_id,
+            claimed_at=now,
+            claim_expires_at=expires_at
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    return expires_at if claimed else None
+
+def promote_next(db: Session, post_id: int) -> Optional[int]:
+    """Hand an unclaimed post to the first person waiting for it.
+
+    Returns the promoted user's id, or None if nobody was waiting or the
+    post can't be claimed. Does not commit.
+    """
+    entry = db.query(ClaimWaitlist).filter(
+        ClaimWaitlist.food_post_id == post_id
+    ).order_by(ClaimWaitlist.created_at, ClaimWaitlist.id).first()
+    if entry is None or claim_post(db, post_id, entry.user_id) is None:
+        return None
+
+    db.delete(entry)
+    logger.info(f"Promoted user {entry.user_id} from the waitlist of food post {post_id}")
+    return entry.user_id
+
+def release_claim(
+    db: Session,
+    post_id: int,
+    claimed_by: Optional[int] = None,
+    expired_before: Optional[datetime] = None
+) -> Tuple[bool, Optional[int]]:
+    """Release the claim on a post and promote the next person waiting.
+
+    claimed_by restricts the release to that claimer's claim, and
+    expired_before to claims that ran out before that time. Returns
+    (whether a claim was released, promoted user id or None). Does not commit.
+    """
+    conditions = [
+        FoodPost.id == post_id,
+        FoodPost.is_available == True,
+        FoodPost.is_claimed == True
+    ]
+    if claimed_by is not None:
+        conditions.append(FoodPost.claimed_by == claimed_by)
+    if expired_before is not None:
+        conditions.append(FoodPost.claim_expires_at < expired_before)
+
+    released = db.execute(
+        update(FoodPost)
+        .where(*conditions)
+        .values(is_claimed=False, claimed_by=None, claimed_at=None, claim_expires_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    if not released:
+        return False, None
+    # The released row stays locked until commit, so the waitlist gets it
+    # before any fresh claim can
+    return True, promote_next(db, post_id)
+
+def expire_claims(db: Session, post_id: Optional[int] = None, limit: int = 100) -> List[Tuple[int, Optional[int]]]:
+    """Release claims that ran out, oldest first, and commit.
+
+    Checks a single post when post_id is given. Returns (post id, promoted
+    user id or None) for every claim released.
+    """
+    now = datetime.utcnow()
+    query = db.query(FoodPost.id).filter(
+        FoodPost.is_claimed == True,
+        FoodPost.claim_expires_at < now,
+        FoodPost.is_available == True
+    )
+    if post_id is not None:
+        query = query.filter(FoodPost.id == post_id)
+    expired_ids = [row.id for row in query.order_by(FoodPost.claim_expires_at).limit(limit)]
+
+    results = []
+    for expired_id in expired_ids:
+        released, promoted = release_claim(db, expired_id, expired_before=now)
+        if released:
+            results.append((expired_id, promoted))
+    db.commit()
+
+    if results:
+        logger.info(f"Expired {len(results)} food post claims")
+    return results
+
+def join_waitlist(db: Session, food_post: FoodPost, user_id: int) -> ClaimWaitlist:
+    """Queue user_id for a claimed post and commit."""
+    if food_post.user_id == user_id:
+        raise HTTPException(status_code=400, detail="Cannot join the waitlist for your own post")
+    if not food_post.is_available:
+        raise HTTPException(status_code=404, detail="Food post not found or no longer available")
+    if not food_post.is_claimed:
+        raise HTTPException(status_code=409, detail="Food post is not claimed; claim it directly")
+    if food_post.claimed_by == user_id:
+        raise HTTPException(status_code=400, detail="You already hold the claim on this post")
+
+    entry = ClaimWaitlist(food_post_id=food_post.id, user_id=user_id)
+    db.add(entry)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Already on the waitlist for this post")
+    return entry
+
+def leave_waitlist(db: Session, post_id: int, user_id: int) -> bool:
+    """Remove user_id from a post's waitlist and commit."""
+    removed = db.query(ClaimWaitlist).filter(
+        ClaimWaitlist.food_post_id == post_id,
+        ClaimWaitlist.user_id == user_id
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removed > 0
+
+def clear_waitlist(db: Session, post_id: int) -> int:
+    """Drop everyone waiting for a post that is no longer on offer. Does not commit."""
+    return db.query(ClaimWaitlist).filter(
+        ClaimWaitlist.food_post_id == post_id
+    ).delete(synchronize_session=False)
+
+def waitlist_status(db: Session, food_post: FoodPost, user_id: int) -> dict:
+    """Where user_id stands for a post: claimer, position in line (1 is next) or neither."""
+    waiting = db.query(func.count(ClaimWaitlist.id)).filter(
+        ClaimWaitlist.food_post_id == food_post.id
+    ).scalar()
+
+    position = None
+    entry = db.query(ClaimWaitlist).filter(
+        ClaimWaitlist.food_post_id == food_post.id,
+        ClaimWaitlist.user_id == user_id
+    ).first()
+    if entry is not None:
+        position = db.query(func.count(ClaimWaitlist.id)).filter(
+            ClaimWaitlist.food_post_id == food_post.id,
+            or_(
+                ClaimWaitlist.created_at < entry.created_at,
+                and_(ClaimWaitlist.created_at == entry.created_at, ClaimWaitlist.id < entry.id)
+            )
+        ).scalar() + 1
+
+    is_claimer = food_post.is_claimed and food_post.claimed_by == user_id
+    return {
+        "food_post_id": food_post.id,
+        "is_claimer": is_claimer,
+        "position": position,
+        "waiting": waiting,
+        "claim_expires_at": food_post.claim_expires_at if is_claimer else None,
+    }
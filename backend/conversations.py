@@ -0,0 +1,284 @@
+"""
+Message threads ("conversations") between two users about an optional food post.
+
+Sending a message updates its thread's last-message fields and the
+receiver's unread counts (per thread and in total) in the same transaction,
+so neither the inbox nor the unread badge has to aggregate over messages. Each user's side of a thread is a
+ConversationParticipant row, so an inbox page is one range scan of
+(user_id, last_message_at, conversation_id), and a thread page is one range
+scan of messages(conversation_id, created_at, id).
+"""
+
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, case, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, contains_eager
+from models import Conversation, ConversationParticipant, Message, User
+from utils import encode_cursor, decode_cursor
+from loaders import MESSAGE_RESPONSE, attach_primary_images
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 200
+
+def get_or_create_conversation(db: Session, user_id: int, other_user_id: int, food_post_id: Optional[int] = None) -> Conversation:
+    """Return the thread between two users about food_post_id, creating it if needed.
+
+    A concurrent first message between the same pair loses the race on the
+    unique key and picks up the winner's row. Both users (and the post, if
+    any) must exist. Does not commit.
+    """
+    user_low_id, user_high_id = sorted((user_id, other_user_id))
+    post_key = food_post_id or 0
+
+    def find(for_update: bool = False) -> Optional[Conversation]:
+        query = db.query(Conversation).filter(
+            Conversation.user_low_id == user_low_id,
+            Conversation.user_high_id == user_high_id,
+            Conversation.post_key == post_key
+        )
+        if for_update:
+            query = query.with_for_update()
+        return query.first()
+
+    conversation = find()
+    if conversation is not None:
+        return conversation
+
+    try:
+        with db.begin_nested():
+            conversation = Conversation(
+                user_low_id=user_low_id,
+                user_high_id=user_high_id,
+                food_post_id=food_post_id,
+                post_key=post_key
+            )
+            conversation.participants = [
+                ConversationParticipant(user_id=participant_id)
+                for participant_id in {user_low_id, user_high_id}
+            ]
+            db.add(conversation)
+        return conversation
+    except IntegrityError:
+        # Under MySQL's REPEATABLE READ a plain read still uses the snapshot
+        # taken before the winner's row existed; a locking read sees it
+        conversation = find(for_update=True)
+        if conversation is None:
+            raise
+        return conversation
+
+def record_message(db: Session, conversation: Conversation, message: Message, unread: bool = True) -> None:
+    """Point a thread at its newest message and bump the receiver's unread count.
+
+    Counters are incremented in SQL rather than read and written back, so
+    concurrent messages don't lose updates. Does not commit.
+    """
+    unread_count = ConversationParticipant.unread_count
+    counted = unread and message.receiver_id != message.sender_id
+    if counted:
+        unread_count = case(
+            (ConversationParticipant.user_id == message.receiver_id, ConversationParticipant.unread_count + 1),
+            else_=ConversationParticipant.unread_count
+        )
+
+    db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation.id)
+        .values(
+            last_message_id=message.id,
+            last_message_at=message.created_at,
+            last_message_preview=message.message[:PREVIEW_LENGTH],
+            last_sender_id=message.sender_id
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(ConversationParticipant)
+        .where(ConversationParticipant.conversation_id == conversation.id)
+        .values(last_message_at=message.created_at, unread_count=unread_count)
+        .execution_options(synchronize_session=False)
+    )
+    if counted:
+        db.execute(
+            update(User)
+            .where(User.id == message.receiver_id)
+            .values(unread_message_count=User.unread_message_count + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+def floored_decrement(column, amount: int):
+    """SQL for column - amount, never below zero."""
+    return case((column > amount, column - amount), else_=0)
+
+def discount_read(db: Session, user_id: int, conversation_id: Optional[int], marked: int) -> None:
+    """Take messages just marked read off the thread's and the user's unread counts."""
+    if conversation_id is not None:
+        db.execute(
+            update(ConversationParticipant)
+            .where(
+                ConversationParticipant.conversation_id == conversation_id,
+                ConversationParticipant.user_id == user_id
+            )
+            .values(
+                unread_count=floored_decrement(ConversationParticipant.unread_count, marked),
+                last_read_at=datetime.utcnow()
+            )
+            .execution_options(synchronize_session=False)
+        )
+    if marked:
+        db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(unread_message_count=floored_decrement(User.unread_message_count, marked))
+            .execution_options(synchronize_session=False)
+        )
+
+def mark_message_read(db: Session, message: Message, user_id: int) -> bool:
+    """Mark one message user_id received as read. Does not commit.
+
+    Returns False if it was already read. Messages to yourself are never counted.
+    """
+    marked = db.execute(
+        update(Message)
+        .where(
+            Message.id == message.id,
+            Message.receiver_id == user_id,
+            Message.sender_id != user_id,
+            Message.is_read == False
+        )
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if marked:
+        discount_read(db, user_id, message.conversation_id, marked)
+    return marked == 1
+
+def mark_conversation_read(db: Session, conversation_id: int, user_id: int) -> int:
+    """Mark every message user_id received in a thread as read. Does not commit.
+
+    Counters drop by the rows the UPDATE actually flipped rather than being
+    reset, so a message that arrives meanwhile stays counted. Returns that
+    number.
+    """
+    marked = db.execute(
+        update(Message)
+        .where(
+            Message.conversation_id == conversation_id,
+            Message.receiver_id == user_id,
+            Message.sender_id != user_id,
+            Message.is_read == False
+        )
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    discount_read(db, user_id, conversation_id, marked)
+    return marked
+
+def get_unread_count(db: Session, user_id: int) -> int:
+    """Total unread messages for user_id: one primary key lookup."""
+    return db.query(User.unread_message_count).filter(User.id == user_id).scalar() or 0
+
+def list_conversations(db: Session, user_id: int, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of a user's inbox, newest thread first, and the next cursor."""
+    query = db.query(ConversationParticipant).join(
+        ConversationParticipant.conversation
+    ).options(
+        contains_eager(ConversationParticipant.conversation).joinedload(Conversation.user_low),
+        contains_eager(ConversationParticipant.conversation).joinedload(Conversation.user_high)
+    ).filter(
+        ConversationParticipant.user_id == user_id,
+        ConversationParticipant.last_message_at.isnot(None)
+    )
+
+    if cursor:
+        last_message_at, conversation_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            ConversationParticipant.last_message_at < last_message_at,
+            and_(
+                ConversationParticipant.last_message_at == last_message_at,
+                ConversationParticipant.conversation_id < conversation_id
+            )
+        ))
+
+    participants = query.order_by(
+        ConversationParticipant.last_message_at.desc(),
+        ConversationParticipant.conversation_id.desc()
+    ).limit(limit).all()
+
+    result = []
+    for participant in participants:
+        conversation = participant.conversation
+        other_user = conversation.user_high if conversation.user_low_id == user_id else conversation.user_low
+        result.append({
+            "id": conversation.id,
+            "food_post_id": conversation.food_post_id,
+            "other_user": other_user,
+            "last_message_id": conversation.last_message_id,
+            "last_message_at": conversation.last_message_at,
+            "last_message_preview": conversation.last_message_preview,
+            "last_sender_id": conversation.last_sender_id,
+            "unread_count": participant.unread_count,
+        })
+
+    next_cursor = None
+    if participants and len(participants) == limit:
+        last = participants[-1]
+        next_cursor = encode_cursor(last.last_message_at, last.conversation_id)
+    return result, next_cursor
+
+def get_participant(db: Session, conversation_id: int, user_id: int) -> Optional[ConversationParticipant]:
+    return db.get(ConversationParticipant, (conversation_id, user_id))
+
+def list_conversation_messages(db: Session, conversation_id: int, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Message], Optional[str]]:
+    """Return one page of a thread, newest message first, and the next cursor."""
+    query = db.query(Message).options(*MESSAGE_RESPONSE).filter(Message.conversation_id == conversation_id)
+
+    if cursor:
+        created_at, message_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Message.created_at < created_at,
+            and_(Message.created_at == created_at, Message.id < message_id)
+        ))
+
+    messages = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()
+    attach_primary_images(db, [message.food_post for message in messages])
+
+    next_cursor = None
+    if messages and len(messages) == limit:
+        next_cursor = encode_cursor(messages[-1].created_at, messages[-1].id)
+    return messages, next_cursor
+
+def backfill_conversations(db: Session, batch_size: int = 500) -> int:
+    """Thread messages sent before conversations existed, oldest first, and commit.
+
+    Only unread messages count towards unread totals. Every worker runs this
+    at startup, so each message is claimed with a conditional UPDATE and only
+    the worker that claims it counts it. Returns the number of messages
+    threaded.
+    """
+    threaded = 0
+    while True:
+        messages = db.query(Message).filter(
+            Message.conversation_id.is_(None)
+        ).order_by(Message.created_at, Message.id).limit(batch_size).all()
+        if not messages:
+            break
+
+        for message in messages:
+            conversation = get_or_create_conversation(db, message.sender_id, message.receiver_id, message.food_post_id)
+            claimed = db.execute(
+                update(Message)
+                .where(Message.id == message.id, Message.conversation_id.is_(None))
+                .values(conversation_id=conversation.id)
+                .execution_options(synchronize_session=False)
+            ).rowcount == 1
+            if claimed:
+                record_message(db, conversation, message, unread=not message.is_read)
+                threaded += 1
+        db.commit()
+
+    if threaded:
+        logger.info(f"Threaded {threaded} existing messages into conversations")
+    return threaded
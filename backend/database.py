@@ -1,18 +1,168 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
+import threading
+import time
 
 # MySQL database configuration
-DATABASE_URL = "mysql+pymysql://root:@localhost:3306/foodshare"
+# DATABASE_URL wins; otherwise it is built from the DB_* variables docker-compose sets
+DATABASE_URL = os.getenv("DATABASE_URL") or URL.create(
+    "mysql+pymysql",
+    username=os.getenv("DB_USER", "root"),
+    password=os.getenv("DB_PASSWORD", ""),
+    host=os.getenv("DB_HOST", "localhost"),
+    port=int(os.getenv("DB_PORT", "3306")),
+    database=os.getenv("DB_NAME", "foodshare"),
+)
 
-engine = create_engine(DATABASE_URL)
+
+def _async_url(url):
+    """Swap the sync driver for its asyncio counterpart (aiomysql / aiosqlite)."""
+    url = make_url(url)
+    async_drivers = {"mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+    return url.set(drivername=async_drivers.get(url.get_backend_name(), url.drivername))
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle connections before MySQL's wait_timeout closes them server-side
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class PoolStats:
+    """Counters describing how hard the connection pool is being used."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.invalidated = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+
+
+pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+
+
+class _WaitTimingMixin:
+    """Records how long callers wait for a connection in self.stats."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_WaitTimingMixin, QueuePool):
+    stats = pool_stats
+
+
+class InstrumentedAsyncQueuePool(_WaitTimingMixin, AsyncAdaptedQueuePool):
+    stats = async_pool_stats
+
+
+def _engine_kwargs(url, poolclass=InstrumentedQueuePool) -> dict:
+    url = make_url(url)
+    kwargs = {}
+    if url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+        # In-memory databases need their single-connection pool
+        if url.database in (None, "", ":memory:"):
+            return kwargs
+    kwargs.update(
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    return kwargs
+
+
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async engine for the hot read endpoints, so they wait on I/O without holding
+# a threadpool thread
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **_engine_kwargs(ASYNC_DATABASE_URL, InstrumentedAsyncQueuePool)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False)
+
+
+def _instrument(pool_owner, stats: PoolStats):
+    @event.listens_for(pool_owner, "checkout")
+    def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.checkouts += 1
+
+    @event.listens_for(pool_owner, "invalidate")
+    def _count_invalidate(dbapi_connection, connection_record, exception):
+        stats.invalidated += 1
+
+
+_instrument(engine, pool_stats)
+_instrument(async_engine.sync_engine, async_pool_stats)
+
+
+def get_pool_stats(pool=None, stats: PoolStats = pool_stats) -> dict:
+    """Snapshot of connection pool usage for the metrics endpoint."""
+    pool = pool if pool is not None else engine.pool
+    snapshot = {
+        "pool_class": type(pool).__name__,
+        "checkouts": stats.checkouts,
+        "timeouts": stats.timeouts,
+        "invalidated": stats.invalidated,
+        "wait_time_total_ms": round(stats.wait_time_total * 1000, 3),
+        "wait_time_max_ms": round(stats.wait_time_max * 1000, 3),
+    }
+    if isinstance(pool, QueuePool):
+        snapshot.update(
+            pool_size=pool.size(),
+            max_overflow=DB_MAX_OVERFLOW,
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    return snapshot
+
+
+def get_async_pool_stats() -> dict:
+    """Snapshot of the async engine's pool usage."""
+    return get_pool_stats(async_engine.pool, async_pool_stats)
+
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,152 @@
+"""
+Background sweep that retires expired food posts and lapsed claims.
+
+Posts whose expiry_date has passed are flipped to unavailable in chunks, each
+its own short transaction, so the feed stops carrying them and no single
+UPDATE holds locks on thousands of rows. The same sweep releases claims
+nobody picked up (see claims.py), handing the posts to their waitlists.
+
+Every worker process runs its own sweep. The updates are conditional, so
+overlapping sweeps just find nothing left to do.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import date, datetime
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import ClaimWaitlist, FoodPost
+from claims import expire_claims
+from realtime import publish_event
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps; 0 disables the background task
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", "300"))
+EXPIRY_SWEEP_BATCH_SIZE = int(os.getenv("EXPIRY_SWEEP_BATCH_SIZE", "500"))
+
+def retire_expired_posts(db: Session, today: Optional[date] = None, batch_size: int = EXPIRY_SWEEP_BATCH_SIZE) -> int:
+    """Mark posts past their expiry date unavailable, batch_size rows per transaction.
+
+    Food is good through its expiry date, so posts are retired the day after.
+    Returns the number of posts retired.
+    """
+    today = today or datetime.utcnow().date()
+    retired = 0
+    while True:
+        # Read off idx_food_posts_available_expiry
+        expired_ids = [row.id for row in db.query(FoodPost.id).filter(
+            FoodPost.is_available == True,
+            FoodPost.expiry_date < today
+        ).limit(batch_size)]
+        if not expired_ids:
+            break
+
+        retired += db.execute(
+            update(FoodPost)
+            .where(FoodPost.id.in_(expired_ids), FoodPost.is_available == True)
+            .values(is_available=False)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.query(ClaimWaitlist).filter(
+            ClaimWaitlist.food_post_id.in_(expired_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        if len(expired_ids) < batch_size:
+            break
+    return retired
+
+def run_expiry_sweep(batch_size: int = EXPIRY_SWEEP_BATCH_SIZE) -> dict:
+    """Run one sweep with its own session and return how many rows it touched.
+
+    "promotions" lists the (post id, user id) of every waitlist promotion.
+    """
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        posts_retired = retire_expired_posts(db, batch_size=batch_size)
+
+        claims_released = 0
+        promotions = []
+        while True:
+            released = expire_claims(db, limit=batch_size)
+            claims_released += len(released)
+            promotions.extend((post_id, promoted) for post_id, promoted in released if promoted is not None)
+            if len(released) < batch_size:
+                break
+    finally:
+        db.close()
+
+    result = {
+        "posts_retired": posts_retired,
+        "claims_released": claims_released,
+        "claims_promoted": len(promotions),
+        "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+    if posts_retired or claims_released:
+        logger.info(f"Expiry sweep: {result}")
+    result["promotions"] = promotions
+    return result
+
+class ExpirySweeper:
+    """Runs run_expiry_sweep every interval seconds on the event loop's threadpool."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.runs = 0
+        self.failures = 0
+        self.posts_retired = 0
+        self.claims_released = 0
+        self.last_run: Optional[dict] = None
+        self.last_run_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_forever())
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                result = await run_in_threadpool(run_expiry_sweep)
+                promotions = result.pop("promotions")
+                self.runs += 1
+                self.posts_retired += result["posts_retired"]
+                self.claims_released += result["claims_released"]
+                self.last_run = result
+                self.last_run_at = datetime.utcnow()
+                for post_id, user_id in promotions:
+                    await publish_event([user_id], "food_post.claim_promoted", {"food_post_id": post_id})
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Expiry sweep failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        """Return totals and the rows touched by the latest run."""
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "posts_retired": self.posts_retired,
+            "claims_released": self.claims_released,
+            "last_run": self.last_run,
+            "last_run_at": self.last_run_at,
+        }
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+expiry_sweeper = ExpirySweeper(EXPIRY_SWEEP_INTERVAL)
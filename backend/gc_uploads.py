@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Garbage-collect uploaded files that no food image references any more.
+
+Run it from cron or by hand, e.g.:
+    python gc_uploads.py --dry-run
+    python gc_uploads.py --min-age-hours 48 --rate 50
+"""
+
+import argparse
+from database import SessionLocal
+from utils import collect_orphan_files, format_file_size
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete orphaned files from the upload storage.")
+    parser.add_argument("--upload-dir", default="uploads", help="storage prefix to scan (default: uploads)")
+    parser.add_argument("--min-age-hours", type=float, default=24, help="skip files younger than this (default: 24)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    parser.add_argument("--rate", type=float, default=0, help="max deletions per second (default: unlimited)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="files checked per database query (default: 1000)")
+    args = parser.parse_args()
+    
+    db = SessionLocal()
+    try:
+        stats = collect_orphan_files(
+            db,
+            upload_dir=args.upload_dir,
+            min_age_hours=args.min_age_hours,
+            dry_run=args.dry_run,
+            max_deletes_per_second=args.rate,
+            batch_size=args.batch_size
+        )
+    finally:
+        db.close()
+    
+    action = "would be deleted" if args.dry_run else "deleted"
+    print(f"🧹 Scanned {stats['scanned']} files, found {stats['orphans']} orphans ({format_file_size(stats['bytes'])})")
+    print(f"✅ {stats['orphans'] if args.dry_run else stats['deleted']} files {action}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Geocoding and geohash helpers for "near me" food post search.
+
+Posts store a full-precision geohash; a radius search is answered by a handful
+of indexed geohash prefix matches (LIKE 'prefix%') followed by a cheap
+distance check, so it works the same on MySQL and SQLite whatever the
+column's collation.
+"""
+
+import os
+import json
+import math
+import logging
+import urllib.parse
+import urllib.request
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Nominatim-compatible search endpoint, e.g. https://nominatim.openstreetmap.org/search.
+# Off by default: pickup addresses are sent to it when posts are created.
+GEOCODER_URL = os.getenv("GEOCODER_URL", "")
+GEOCODER_TIMEOUT = float(os.getenv("GEOCODER_TIMEOUT", "3"))
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+def geocode_address(address: str) -> Optional[Tuple[float, float]]:
+    """Resolve a free-form address to (latitude, longitude), or None if it can't be found."""
+    if not GEOCODER_URL or not address:
+        return None
+
+    url = f"{GEOCODER_URL}?{urllib.parse.urlencode({'q': address, 'format': 'json', 'limit': 1})}"
+    request = urllib.request.Request(url, headers={"User-Agent": "FoodShare/1.0"})
+    try:
+        with urllib.request.urlopen(request, timeout=GEOCODER_TIMEOUT) as response:
+            results = json.load(response)
+        if not results:
+            logger.info(f"No geocoding result for address: {address}")
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
+    except Exception as e:
+        logger.warning(f"Geocoding failed for address {address}: {str(e)}")
+        return None
+
+def parse_lat_lon(value: str) -> Tuple[float, float]:
+    """Parse a "lat,lon" string. Raises ValueError if malformed or out of range."""
+    lat_str, lon_str = value.split(",")
+    lat, lon = float(lat_str), float(lon_str)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"Coordinates out of range: {value}")
+    return lat, lon
+
+def encode_geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a coordinate as a geohash string."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits, bit_count, even = 0, 0, True
+
+    while len(geohash) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+
+    return "".join(geohash)
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    """Return the (lat, lon) size in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+def geohash_prefixes(lat: float, lon: float, radius_km: float) -> List[str]:
+    """Return the geohash prefixes whose cells cover a circle of radius_km.
+
+    The longest prefix whose cell is at least as large as the radius is used,
+    so the bounding box spans at most 3x3 cells.
+    """
+    d_lat = radius_km / KM_PER_DEGREE
+    d_lon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+
+    precision = 1
+    while precision < GEOHASH_PRECISION:
+        cell_lat, cell_lon = _cell_size(precision + 1)
+        if cell_lat < d_lat or cell_lon < d_lon:
+            break
+        precision += 1
+
+    prefixes = set()
+    for sample_lat in (lat - d_lat, lat, lat + d_lat):
+        for sample_lon in (lon - d_lon, lon, lon + d_lon):
+            sample_lat = min(max(sample_lat, -90.0), 90.0)
+            sample_lon = (sample_lon + 180.0) % 360.0 - 180.0
+            prefixes.add(encode_geohash(sample_lat, sample_lon, precision))
+    return sorted(prefixes)
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two coordinates in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,79 @@
+"""
+Image processing for food post uploads.
+
+Each upload is decoded once, rotated according to its EXIF orientation and
+re-encoded without metadata (which also drops any GPS tags) into a few
+downscaled variants, so the feed never has to ship the original file.
+"""
+
+import io
+import os
+import logging
+from typing import BinaryIO, Dict, Tuple
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> longest edge in pixels, largest first
+IMAGE_VARIANTS = {
+    "full": 1600,
+    "card": 600,
+    "thumb": 200,
+}
+
+WEBP_SUPPORTED = features.check("webp")
+VARIANT_FORMAT, VARIANT_EXTENSION = ("WEBP", ".webp") if WEBP_SUPPORTED else ("JPEG", ".jpg")
+VARIANT_QUALITY = 80
+
+# Refuse to decode anything larger than this many pixels (about 40 MP by default)
+Image.MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "40000000"))
+
+class InvalidImageError(ValueError):
+    """Raised when an upload can't be decoded as an image."""
+
+def _encode(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    if VARIANT_FORMAT == "WEBP":
+        image.save(buffer, format="WEBP", quality=VARIANT_QUALITY, method=4)
+    else:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, format="JPEG", quality=VARIANT_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+def render_variants(source: BinaryIO) -> Dict[str, Tuple[bytes, str]]:
+    """Decode an uploaded image and return {variant: (encoded bytes, extension)}.
+
+    Variants are never upscaled; each one is resized from the previous, larger
+    variant rather than from the original, which keeps the work proportional
+    to the output size.
+    """
+    largest = max(IMAGE_VARIANTS.values())
+    try:
+        source.seek(0)
+        image = Image.open(source)
+        # JPEGs can be decoded straight at 1/2, 1/4 or 1/8 scale, which keeps
+        # peak memory near the largest variant instead of the full photo
+        scale = largest / max(image.size)
+        if scale < 1:
+            image.draft(None, (int(image.width * scale), int(image.height * scale)))
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImageError(str(e)) from e
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    # Keep only the colour profile; EXIF, XMP and comments are not re-encoded
+    icc_profile = image.info.get("icc_profile")
+    image.info = {"icc_profile": icc_profile} if icc_profile else {}
+
+    variants = {}
+    for name, max_edge in IMAGE_VARIANTS.items():
+        if max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        variants[name] = (_encode(image), VARIANT_EXTENSION)
+
+    source.seek(0)
+    return variants
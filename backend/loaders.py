@@ -0,0 +1,77 @@
+"""
+Loader profiles: the relationships each response model serializes, loaded up front.
+
+Response models nest users, categories, images and food posts. Serializing an
+ORM row whose relationships were not loaded with the query fires one lazy
+SELECT per relationship per row, so a page of 20 messages cost dozens of
+queries. Every query whose ORM rows end up in a response model applies the
+matching profile here (the feed skips ORM objects altogether, see
+serialization.py):
+
+    db.query(Message).options(*MESSAGE_RESPONSE)
+
+Many-to-one relationships are joined into the same SELECT; collections use
+selectinload (one extra SELECT per page, not per row). primary_image is not
+a relationship, so FoodPostListResponse rows get it from
+attach_primary_images, one batched query per page.
+
+query_budget.py checks that the statement count per endpoint stays flat as
+the page size grows.
+"""
+
+from typing import Iterable, Optional
+from sqlalchemy.orm import Session, joinedload, selectinload
+from models import FoodPost, Message, Review
+from utils import get_primary_images
+
+# FoodPostListResponse: user, category (+ attach_primary_images)
+FOOD_POST_LIST = (
+    joinedload(FoodPost.user),
+    joinedload(FoodPost.category),
+)
+
+# FoodPostResponse: user, category, images
+FOOD_POST_DETAIL = (
+    joinedload(FoodPost.user),
+    joinedload(FoodPost.category),
+    selectinload(FoodPost.images),
+)
+
+# MessageResponse: sender, receiver, food_post as FoodPostListResponse
+MESSAGE_RESPONSE = (
+    joinedload(Message.sender),
+    joinedload(Message.receiver),
+    joinedload(Message.food_post).options(*FOOD_POST_LIST),
+)
+
+# ReviewResponse: reviewer, reviewed_user, food_post as FoodPostListResponse
+REVIEW_RESPONSE = (
+    joinedload(Review.reviewer),
+    joinedload(Review.reviewed_user),
+    joinedload(Review.food_post).options(*FOOD_POST_LIST),
+)
+
+def attach_primary_images(db: Session, food_posts: Iterable[Optional[FoodPost]]) -> None:
+    """Set primary_image on each food post for FoodPostListResponse, in one batched query."""
+    food_posts = [food_post for food_post in food_posts if food_post is not None]
+    primary_images = get_primary_images(db, list({food_post.id for food_post in food_posts}))
+    for food_post in food_posts:
+        food_post.primary_image = primary_images.get(food_post.id)
+
+def load_food_post(db: Session, post_id: int) -> Optional[FoodPost]:
+    """Load a food post for FoodPostResponse, replacing any stale copy in the session."""
+    return db.query(FoodPost).options(*FOOD_POST_DETAIL).populate_existing().filter(FoodPost.id == post_id).first()
+
+def load_message(db: Session, message_id: int) -> Optional[Message]:
+    """Load a message for MessageResponse."""
+    message = db.query(Message).options(*MESSAGE_RESPONSE).populate_existing().filter(Message.id == message_id).first()
+    if message is not None:
+        attach_primary_images(db, [message.food_post])
+    return message
+
+def load_review(db: Session, review_id: int) -> Optional[Review]:
+    """Load a review for ReviewResponse."""
+    review = db.query(Review).options(*REVIEW_RESPONSE).populate_existing().filter(Review.id == review_id).first()
+    if review is not None:
+        attach_primary_images(db, [review.food_post])
+    return review
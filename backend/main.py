@@ -1,13 +1,17 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Query
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Query, Request, Response, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import math
 import os
 
 # Import our modules
-from database import get_db, engine, Base
+from database import get_db, get_async_db, engine, Base, SessionLocal, get_pool_stats, get_async_pool_stats
 from models import User, Category, FoodPost, FoodImage, Message, Review
 from schemas import (
     UserCreate, UserResponse, UserLogin, UserUpdate,
@@ -15,22 +19,50 @@ from schemas import (
     FoodPostCreate, FoodPostResponse, FoodPostUpdate, FoodPostListResponse, FoodPostSearch,
     FoodImageCreate, FoodImageResponse,
     MessageCreate, MessageResponse, MessageSearch,
-    ReviewCreate, ReviewResponse,
+    ConversationResponse, ConversationSearch, UnreadCount, MarkReadResponse,
+    ReviewCreate, ReviewResponse, ReviewSearch, UserRatingResponse,
+    ClaimResponse, WaitlistStatus,
     Token, FileUploadResponse
 )
 from auth import (
     authenticate_user, create_access_token, create_user,
     get_current_user, get_current_active_user, get_current_admin_user,
+    get_user_from_token, invalidate_cached_user, get_password_hash_async, rehash_password,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from passwords import password_pool, needs_rehash
+from cache import reference_cache, cached_json_response
+from middleware import BodySizeLimitMiddleware, CachedStaticFiles
+from storage import storage, LocalStorage
+from search import init_search_index, apply_text_search
+from expiry import expiry_sweeper
+from serialization import response_columns, construct, json_response
+from loaders import (
+    MESSAGE_RESPONSE, attach_primary_images,
+    load_food_post, load_message, load_review
+)
+from ratings import add_rating, get_rating, list_reviews, backfill_ratings
+from realtime import manager as realtime_manager, broker as realtime_broker, publish_event
+from conversations import (
+    get_or_create_conversation, record_message, list_conversations,
+    get_participant, list_conversation_messages, backfill_conversations,
+    mark_message_read, mark_conversation_read, get_unread_count
+)
+from claims import (
+    claim_post, release_claim, expire_claims,
+    join_waitlist, leave_waitlist, clear_waitlist, waitlist_status
+)
+from geo import geocode_address, parse_lat_lon, encode_geohash, geohash_prefixes, haversine_km, KM_PER_DEGREE
 from utils import (
-    save_uploaded_file, delete_file, save_food_images, delete_food_images,
-    get_primary_image, validate_image_file, format_file_size
+    save_uploaded_file, delete_file, save_food_post_with_images, delete_food_images,
+    get_primary_images, validate_image_file, format_file_size,
+    encode_cursor, decode_cursor, image_executor
 )
 
 # Create database tables
 print("🔄 Initializing database...")
 Base.metadata.create_all(bind=engine)
+init_search_index(engine)
 print("✅ Database tables created!")
 
 # Create test users if they don't exist
@@ -96,6 +128,34 @@ def create_test_users():
         print(f"⚠️  Database not ready yet: {e}")
         print("ℹ️  Test users will be created when the database is initialized")
 
+def thread_existing_messages():
+    """File messages sent before conversations existed into their threads."""
+    from sqlalchemy.orm import Session
+    from sqlalchemy.exc import OperationalError
+    
+    try:
+        with Session(bind=engine) as db:
+            threaded = backfill_conversations(db)
+        if threaded:
+            print(f"✅ Threaded {threaded} existing messages into conversations")
+    except OperationalError as e:
+        print(f"⚠️  Database not ready yet: {e}")
+        print("ℹ️  Existing messages will be threaded on the next startup")
+
+def build_rating_totals():
+    """Sum up reviews written before rating totals were kept."""
+    from sqlalchemy.orm import Session
+    from sqlalchemy.exc import OperationalError
+    
+    try:
+        with Session(bind=engine) as db:
+            users = backfill_ratings(db)
+        if users:
+            print(f"✅ Built rating totals for {users} users from existing reviews")
+    except OperationalError as e:
+        print(f"⚠️  Database not ready yet: {e}")
+        print("ℹ️  Rating totals will be built on the next startup")
+
 app = FastAPI(title="Food Sharing API", version="1.0.0")
 
 @app.on_event("startup")
@@ -103,15 +163,30 @@ async def startup_event():
     """Initialize database and create test users on startup."""
     print("🚀 Starting FoodShare API...")
     create_test_users()
+    thread_existing_messages()
+    build_rating_totals()
+    await realtime_broker.start(realtime_manager.deliver)
+    expiry_sweeper.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and worker pools."""
+    await expiry_sweeper.stop()
+    await realtime_broker.stop()
+    password_pool.shutdown()
+    image_executor.shutdown(wait=False)
 
 # Initialize test users after app creation
 create_test_users()
 
-# Ensure uploads folder exists
-os.makedirs("uploads", exist_ok=True)
+# Serve uploaded images from local disk; other backends hand out their own URLs
+if isinstance(storage, LocalStorage):
+    os.makedirs(storage.path("uploads"), exist_ok=True)
+    app.mount("/uploads", CachedStaticFiles(directory=storage.path("uploads")), name="uploads")
 
-# Serve static files (uploaded images)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Reject oversized request bodies while they are still arriving
+MAX_REQUEST_BODY_SIZE = int(os.getenv("MAX_REQUEST_BODY_SIZE", str(60 * 1024 * 1024)))
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=MAX_REQUEST_BODY_SIZE)
 
 # CORS middleware
 app.add_middleware(
@@ -120,6 +195,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Root endpoint
@@ -127,30 +203,50 @@ app.add_middleware(
 def home():
     return {"message": "Food Sharing API is running!", "version": "1.0.0"}
 
+@app.get("/metrics")
+def get_metrics():
+    """Runtime counters for capacity planning."""
+    return {
+        "db_pool": get_pool_stats(),
+        "async_db_pool": get_async_pool_stats(),
+        "password_pool": password_pool.stats(),
+        "expiry_sweeper": expiry_sweeper.stats(),
+        "websockets": realtime_manager.stats(),
+    }
+
 # Authentication endpoints
 @app.post("/register", response_model=UserResponse)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     """Register a new user."""
-    # Check if username already exists
-    if db.query(User).filter(User.username == user.username).first():
-        raise HTTPException(
-            status_code=400,
-            detail="Username already registered"
-        )
+    def check_existing():
+        # Check if username already exists
+        if db.query(User).filter(User.username == user.username).first():
+            raise HTTPException(
+                status_code=400,
+                detail="Username already registered"
+            )
+        
+        # Check if email already exists
+        if db.query(User).filter(User.email == user.email).first():
+            raise HTTPException(
+                status_code=400,
+                detail="Email already registered"
+            )
     
-    # Check if email already exists
-    if db.query(User).filter(User.email == user.email).first():
-        raise HTTPException(
-            status_code=400,
-            detail="Email already registered"
-        )
+    await run_in_threadpool(check_existing)
     
-    return create_user(db, user.dict())
+    # Hash in the password worker pool, not on the event loop
+    hashed_password = await get_password_hash_async(user.password)
+    return await run_in_threadpool(create_user, db, user.dict(), hashed_password)
 
 @app.post("/login", response_model=Token)
-def login_user(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login_user(
+    user_credentials: UserLogin,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     """Login user and return access token."""
-    user = authenticate_user(db, user_credentials.username, user_credentials.password)
+    user = await authenticate_user(db, user_credentials.username, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -158,9 +254,13 @@ def login_user(user_credentials: UserLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Upgrade hashes made with an older cost factor after the response is sent
+    if needs_rehash(user.password_hash):
+        background_tasks.add_task(rehash_password, user.id, user_credentials.password)
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -180,14 +280,34 @@ def update_current_user(
         setattr(current_user, field, value)
     
     db.commit()
+    invalidate_cached_user(current_user.username)
     db.refresh(current_user)
     return current_user
 
+@app.get("/me/unread", response_model=UnreadCount)
+async def get_unread_messages(
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get how many received messages the current user hasn't read.
+
+    Reads the counter maintained by send_message and the mark-read endpoints
+    instead of counting messages.
+    """
+    unread = await db.run_sync(get_unread_count, current_user.id)
+    return UnreadCount(unread_messages=unread)
+
 # Category endpoints
 @app.get("/categories", response_model=List[CategoryResponse])
-def get_categories(db: Session = Depends(get_db)):
-    """Get all food categories."""
-    return db.query(Category).all()
+async def get_categories(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Get all food categories (cached, revalidated with ETag)."""
+    def load_categories(session: Session) -> List[CategoryResponse]:
+        return [CategoryResponse.model_validate(category) for category in session.query(Category).all()]
+    
+    return await cached_json_response(
+        request, reference_cache, "categories",
+        lambda: db.run_sync(load_categories)
+    )
 
 @app.post("/categories", response_model=CategoryResponse)
 def create_category(
@@ -200,51 +320,135 @@ def create_category(
     db.add(db_category)
     db.commit()
     db.refresh(db_category)
+    reference_cache.invalidate("categories")
     return db_category
 
 # Food Post endpoints
-@app.get("/food-posts", response_model=List[FoodPostListResponse])
-def get_food_posts(
-    search: FoodPostSearch = Depends(),
-    db: Session = Depends(get_db)
-):
-    """Get food posts with optional filtering."""
-    query = db.query(FoodPost)
+# Feed rows carry only the columns FoodPostListResponse serializes (see serialization.py)
+FEED_COLUMNS = (
+    response_columns(FoodPostListResponse, FoodPost) +
+    response_columns(UserResponse, User, "user_") +
+    response_columns(CategoryResponse, Category, "category_")
+)
+FEED_IMAGE_COLUMNS = response_columns(FoodImageResponse, FoodImage) + [FoodImage.food_post_id]
+
+def list_food_posts(db: Session, search: FoodPostSearch) -> Tuple[List[FoodPostListResponse], Optional[str]]:
+    """Run a food post search and return the page plus the next cursor, if any.
+
+    Rows are read as plain columns and the response models built without
+    validation, since every value comes from a typed column.
+    """
+    query = db.query(*FEED_COLUMNS).select_from(FoodPost).join(FoodPost.user).outerjoin(FoodPost.category)
+    relevance = None
+    origin = None
     
     # Apply filters
     if search.query:
-        query = query.filter(
-            FoodPost.title.contains(search.query) |
-            FoodPost.description.contains(search.query)
-        )
+        query, relevance = apply_text_search(db, query, search.query)
     
     if search.category_id:
         query = query.filter(FoodPost.category_id == search.category_id)
     
+    # Location filters use the users join the columns already come from
     if search.city:
-        query = query.join(User).filter(User.city == search.city)
-    
+        query = query.filter(User.city == search.city)
     if search.state:
-        query = query.join(User).filter(User.state == search.state)
+        query = query.filter(User.state == search.state)
     
     if search.is_available is not None:
         query = query.filter(FoodPost.is_available == search.is_available)
     
-    # Apply pagination and load relationships
-    posts = query.options(
-        joinedload(FoodPost.user),
-        joinedload(FoodPost.category)
-    ).offset(search.offset).limit(search.limit).all()
+    if search.is_claimed is not None:
+        query = query.filter(FoodPost.is_claimed == search.is_claimed)
     
-    # Add primary image to each post
+    if search.near:
+        try:
+            origin = parse_lat_lon(search.near)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="near must be given as 'lat,lon'")
+        if not 0 < search.radius_km <= 100:
+            raise HTTPException(status_code=400, detail="radius_km must be between 0 and 100")
+        
+        # Narrow to nearby geohash cells using the index, then trim to the circle
+        # with a flat-earth distance that needs no trig functions in SQL
+        lat, lon = origin
+        lon_scale = math.cos(math.radians(lat))
+        d_lat = FoodPost.latitude - lat
+        d_lon = (FoodPost.longitude - lon) * lon_scale
+        distance_sq = d_lat * d_lat + d_lon * d_lon
+        query = query.filter(
+            or_(*[
+                FoodPost.geohash.like(f"{prefix}%")
+                for prefix in geohash_prefixes(lat, lon, search.radius_km)
+            ]),
+            distance_sq <= (search.radius_km / KM_PER_DEGREE) ** 2
+        )
+        relevance = distance_sq.asc()
+    
+    # Keyset pagination: continue strictly after the last (created_at, id) seen
+    if search.cursor and relevance is not None:
+        raise HTTPException(status_code=400, detail="Cursor pagination is not supported with query or near searches")
+    
+    if search.cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(search.cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(or_(
+            FoodPost.created_at < cursor_created_at,
+            and_(FoodPost.created_at == cursor_created_at, FoodPost.id < cursor_id)
+        ))
+    
+    # Best matches or nearest first when searching, then a stable ordering
+    # backed by idx_food_posts_created_at_id
+    if relevance is not None:
+        query = query.order_by(relevance)
+    query = query.order_by(FoodPost.created_at.desc(), FoodPost.id.desc())
+    
+    if not search.cursor and search.offset:
+        query = query.offset(search.offset)
+    
+    # Apply pagination
+    rows = [row._mapping for row in query.limit(search.limit)]
+    
+    next_cursor = None
+    if rows and len(rows) == search.limit and relevance is None:
+        last_row = rows[-1]
+        next_cursor = encode_cursor(last_row["created_at"], last_row["id"])
+    
+    # Add primary image to each post (batched to avoid one images query per post)
+    primary_images = get_primary_images(db, [row["id"] for row in rows], FEED_IMAGE_COLUMNS)
     result = []
-    for post in posts:
-        post_dict = post.__dict__.copy()
-        primary_image = get_primary_image(post)
-        post_dict['primary_image'] = primary_image
-        result.append(FoodPostListResponse(**post_dict))
-    
-    return result
+    for row in rows:
+        image = primary_images.get(row["id"])
+        distance_km = None
+        if origin:
+            distance_km = round(haversine_km(origin[0], origin[1], row["latitude"], row["longitude"]), 2)
+        result.append(construct(
+            FoodPostListResponse, row,
+            user=construct(UserResponse, row, "user_"),
+            category=construct(CategoryResponse, row, "category_") if row["category_id"] is not None else None,
+            primary_image=construct(FoodImageResponse, image._mapping) if image is not None else None,
+            distance_km=distance_km
+        ))
+    
+    return result, next_cursor
+
+@app.get("/food-posts", response_model=List[FoodPostListResponse])
+async def get_food_posts(
+    search: FoodPostSearch = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get food posts with optional filtering.
+
+    Posts are returned newest first. Pass the ``X-Next-Cursor`` response header
+    back as ``cursor`` to fetch the next page without an OFFSET scan; ``offset``
+    is still honoured when no cursor is given. Text searches are ranked by
+    relevance and ``near=lat,lon`` searches by distance instead.
+    """
+    result, next_cursor = await db.run_sync(list_food_posts, search)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return json_response(FoodPostListResponse, result, headers)
 
 @app.post("/food-posts", response_model=FoodPostResponse)
 def create_food_post(
@@ -256,11 +460,17 @@ def create_food_post(
     pickup_location: str = Form(...),
     pickup_time_start: Optional[str] = Form(None),
     pickup_time_end: Optional[str] = Form(None),
+    latitude: Optional[float] = Form(None),
+    longitude: Optional[float] = Form(None),
     images: List[UploadFile] = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Create a new food post."""
+    """Create a new food post.
+
+    Coordinates sent by the client are used as-is; otherwise the pickup
+    location is geocoded once here so "near me" searches can find the post.
+    """
     # Validate images
     for image in images:
         if not validate_image_file(image):
@@ -291,22 +501,30 @@ def create_food_post(
     if pickup_time_end:
         food_post_data["pickup_time_end"] = datetime.strptime(pickup_time_end, "%H:%M").time()
     
-    db_food_post = FoodPost(**food_post_data)
-    db.add(db_food_post)
-    db.commit()
-    db.refresh(db_food_post)
+    if latitude is not None and longitude is not None:
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise HTTPException(status_code=400, detail="Invalid latitude/longitude")
+        coordinates = (latitude, longitude)
+    else:
+        coordinates = geocode_address(pickup_location)
     
-    # Save images
-    save_food_images(db, db_food_post.id, images)
+    if coordinates:
+        food_post_data["latitude"], food_post_data["longitude"] = coordinates
+        food_post_data["geohash"] = encode_geohash(*coordinates)
     
-    # Refresh to get images
-    db.refresh(db_food_post)
-    return db_food_post
+    # Store the images concurrently, then insert the post and its images together
+    db_food_post = save_food_post_with_images(db, FoodPost(**food_post_data), images)
+    
+    return load_food_post(db, db_food_post.id)
 
 @app.get("/food-posts/{post_id}", response_model=FoodPostResponse)
-def get_food_post(post_id: int, db: Session = Depends(get_db)):
+async def get_food_post(post_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific food post."""
-    food_post = db.query(FoodPost).filter(FoodPost.id == post_id).first()
+    def serialize_food_post(session: Session) -> Optional[FoodPostResponse]:
+        food_post = load_food_post(session, post_id)
+        return FoodPostResponse.model_validate(food_post) if food_post else None
+    
+    food_post = await db.run_sync(serialize_food_post)
     if not food_post:
         raise HTTPException(status_code=404, detail="Food post not found")
     return food_post
@@ -329,9 +547,12 @@ def update_food_post(
     for field, value in food_post_update.dict(exclude_unset=True).items():
         setattr(food_post, field, value)
     
+    # Once the food is gone nobody is waiting for it any more
+    if not food_post.is_available:
+        clear_waitlist(db, post_id)
+    
     db.commit()
-    db.refresh(food_post)
-    return food_post
+    return load_food_post(db, post_id)
 
 @app.delete("/food-posts/{post_id}")
 def delete_food_post(
@@ -362,67 +583,315 @@ def delete_food_post(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete food post: {str(e)}")
 
-@app.post("/food-posts/{post_id}/claim")
+def notify_claim_promotions(background_tasks: BackgroundTasks, promotions: List[Tuple[int, Optional[int]]]):
+    """Tell users promoted off a waitlist that a post is now theirs."""
+    for post_id, user_id in promotions:
+        if user_id is not None:
+            background_tasks.add_task(publish_event, [user_id], "food_post.claim_promoted", {"food_post_id": post_id})
+
+@app.post("/food-posts/{post_id}/claim", response_model=ClaimResponse)
 def claim_food_post(
     post_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Claim a food post."""
-    # Use SELECT FOR UPDATE to prevent race conditions
-    food_post = db.query(FoodPost).filter(
+    """Claim a food post for CLAIM_TTL_MINUTES (see claims.py).
+
+    The claim is a single conditional UPDATE, so concurrent claimers never
+    wait on a row lock: the database lets exactly one of them match the row,
+    and everyone else sees a row count of zero. Losers can join the waitlist.
+    """
+    claim_expires_at = claim_post(db, post_id, current_user.id)
+    db.commit()
+    
+    # A claim that ran out is released first (to the waitlist, if anyone is on it)
+    if claim_expires_at is None:
+        expired = expire_claims(db, post_id)
+        notify_claim_promotions(background_tasks, expired)
+        if expired:
+            claim_expires_at = claim_post(db, post_id, current_user.id)
+            db.commit()
+    
+    if claim_expires_at is not None:
+        owner_id = db.query(FoodPost.user_id).filter(FoodPost.id == post_id).scalar()
+        background_tasks.add_task(publish_event, [owner_id, current_user.id], "food_post.claimed", {
+            "food_post_id": post_id,
+            "claimed_by": current_user.id,
+            "claim_expires_at": claim_expires_at,
+        })
+        return ClaimResponse(message="Food post claimed successfully", claim_expires_at=claim_expires_at)
+    
+    # Nothing matched: only the owner of an open post gets a different answer
+    owner_id = db.query(FoodPost.user_id).filter(
         FoodPost.id == post_id,
         FoodPost.is_available == True,
         FoodPost.is_claimed == False
-    ).with_for_update().first()
-    
+    ).scalar()
+    if owner_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Cannot claim your own post")
+    raise HTTPException(status_code=404, detail="Food post not found or no longer available")
+
+@app.post("/food-posts/{post_id}/release")
+def release_food_post_claim(
+    post_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Give up a claim, or as the owner release a claimer who didn't show up.
+
+    The post passes to the first person on its waitlist, if any.
+    """
+    food_post = db.query(FoodPost).filter(FoodPost.id == post_id).first()
     if not food_post:
-        raise HTTPException(status_code=404, detail="Food post not found or no longer available")
+        raise HTTPException(status_code=404, detail="Food post not found")
     
+    previous_claimant = food_post.claimed_by
     if food_post.user_id == current_user.id:
-        raise HTTPException(status_code=400, detail="Cannot claim your own post")
+        released, promoted = release_claim(db, post_id)
+    else:
+        released, promoted = release_claim(db, post_id, claimed_by=current_user.id)
+    db.commit()
     
-    # Double-check conditions after acquiring lock
-    if not food_post.is_available or food_post.is_claimed:
-        raise HTTPException(status_code=400, detail="Food post is no longer available")
+    if not released:
+        raise HTTPException(status_code=400, detail="No claim of yours to release on this post")
     
-    food_post.is_claimed = True
-    food_post.claimed_by = current_user.id
-    food_post.claimed_at = datetime.utcnow()
+    background_tasks.add_task(publish_event, [food_post.user_id, previous_claimant], "food_post.claim_released", {
+        "food_post_id": post_id,
+        "released_by": current_user.id,
+        "next_claimant_promoted": promoted is not None,
+    })
+    notify_claim_promotions(background_tasks, [(post_id, promoted)])
+    return {"message": "Claim released", "next_claimant_promoted": promoted is not None}
+
+@app.post("/food-posts/{post_id}/waitlist", response_model=WaitlistStatus)
+def join_food_post_waitlist(
+    post_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Queue for a claimed post; it is yours automatically when the claim lapses."""
+    notify_claim_promotions(background_tasks, expire_claims(db, post_id))
+    food_post = db.query(FoodPost).filter(FoodPost.id == post_id).first()
+    if not food_post:
+        raise HTTPException(status_code=404, detail="Food post not found")
     
-    db.commit()
-    return {"message": "Food post claimed successfully"}
+    join_waitlist(db, food_post, current_user.id)
+    return waitlist_status(db, food_post, current_user.id)
+
+@app.get("/food-posts/{post_id}/waitlist", response_model=WaitlistStatus)
+def get_food_post_waitlist_status(
+    post_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the current user's place for a post: claimer, position in line or neither."""
+    notify_claim_promotions(background_tasks, expire_claims(db, post_id))
+    food_post = db.query(FoodPost).filter(FoodPost.id == post_id).first()
+    if not food_post:
+        raise HTTPException(status_code=404, detail="Food post not found")
+    
+    return waitlist_status(db, food_post, current_user.id)
+
+@app.delete("/food-posts/{post_id}/waitlist")
+def leave_food_post_waitlist(
+    post_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Leave a post's waitlist."""
+    if not leave_waitlist(db, post_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Not on the waitlist for this post")
+    return {"message": "Left the waitlist"}
 
 # Message endpoints
 @app.get("/messages", response_model=List[MessageResponse])
-def get_messages(
+async def get_messages(
     search: MessageSearch = Depends(),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get messages for current user with pagination."""
-    messages = db.query(Message).filter(
-        (Message.sender_id == current_user.id) |
-        (Message.receiver_id == current_user.id)
-    ).order_by(Message.created_at.desc()).offset(search.offset).limit(search.limit).all()
-    return messages
+    user_id = current_user.id
+    
+    def load_messages(session: Session) -> List[MessageResponse]:
+        messages = session.query(Message).options(*MESSAGE_RESPONSE).filter(
+            (Message.sender_id == user_id) |
+            (Message.receiver_id == user_id)
+        ).order_by(Message.created_at.desc()).offset(search.offset).limit(search.limit).all()
+        attach_primary_images(session, [message.food_post for message in messages])
+        return [MessageResponse.model_validate(message) for message in messages]
+    
+    return await db.run_sync(load_messages)
 
 @app.post("/messages", response_model=MessageResponse)
 def send_message(
     message: MessageCreate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Send a message to another user."""
+    """Send a message to another user.
+
+    The message is filed under its conversation (created on first contact),
+    and the thread's last message and the receiver's unread count are updated
+    in the same transaction.
+    """
+    if db.get(User, message.receiver_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if message.food_post_id is not None and db.get(FoodPost, message.food_post_id) is None:
+        raise HTTPException(status_code=404, detail="Food post not found")
+    
+    conversation = get_or_create_conversation(db, current_user.id, message.receiver_id, message.food_post_id)
     db_message = Message(
         sender_id=current_user.id,
+        conversation_id=conversation.id,
+        created_at=datetime.utcnow(),
         **message.dict()
     )
     db.add(db_message)
+    db.flush()
+    record_message(db, conversation, db_message)
     db.commit()
-    db.refresh(db_message)
+    db_message = load_message(db, db_message.id)
+    
+    background_tasks.add_task(publish_event, [db_message.sender_id, db_message.receiver_id], "message.created", {
+        "id": db_message.id,
+        "conversation_id": db_message.conversation_id,
+        "sender_id": db_message.sender_id,
+        "receiver_id": db_message.receiver_id,
+        "food_post_id": db_message.food_post_id,
+        "preview": db_message.message[:200],
+        "created_at": db_message.created_at,
+    })
     return db_message
 
+def unread_after_marking(background_tasks: BackgroundTasks, db: Session, user_id: int, conversation_id: Optional[int], marked: int) -> MarkReadResponse:
+    """Build the mark-read response and sync the badge on the user's other open tabs."""
+    unread = get_unread_count(db, user_id)
+    if marked:
+        background_tasks.add_task(publish_event, [user_id], "messages.read", {
+            "conversation_id": conversation_id,
+            "marked_read": marked,
+            "unread_messages": unread,
+        })
+    return MarkReadResponse(marked_read=marked, unread_messages=unread)
+
+@app.post("/messages/{message_id}/read", response_model=MarkReadResponse)
+def read_message(
+    message_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Mark a message you received as read."""
+    message = db.query(Message).filter(
+        Message.id == message_id,
+        Message.receiver_id == current_user.id
+    ).first()
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    marked = int(mark_message_read(db, message, current_user.id))
+    db.commit()
+    return unread_after_marking(background_tasks, db, current_user.id, message.conversation_id, marked)
+
+@app.post("/conversations/{conversation_id}/read", response_model=MarkReadResponse)
+def read_conversation(
+    conversation_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Mark every message you received in a conversation as read."""
+    if get_participant(db, conversation_id, current_user.id) is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    marked = mark_conversation_read(db, conversation_id, current_user.id)
+    db.commit()
+    return unread_after_marking(background_tasks, db, current_user.id, conversation_id, marked)
+
+@app.get("/conversations", response_model=List[ConversationResponse])
+async def get_conversations(
+    response: Response,
+    search: ConversationSearch = Depends(),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the current user's conversations, most recently active first.
+
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` for the next page.
+    """
+    try:
+        result, next_cursor = await db.run_sync(list_conversations, current_user.id, search.limit, search.cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return result
+
+@app.get("/conversations/{conversation_id}/messages", response_model=List[MessageResponse])
+async def get_conversation_messages(
+    conversation_id: int,
+    response: Response,
+    search: ConversationSearch = Depends(),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the messages of one conversation, newest first, with keyset pagination."""
+    user_id = current_user.id
+    
+    def load_messages(session: Session) -> Tuple[List[MessageResponse], Optional[str]]:
+        if get_participant(session, conversation_id, user_id) is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        messages, next_cursor = list_conversation_messages(session, conversation_id, search.limit, search.cursor)
+        return [MessageResponse.model_validate(message) for message in messages], next_cursor
+    
+    try:
+        result, next_cursor = await db.run_sync(load_messages)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return result
+
+# Real-time events
+def resolve_websocket_user(token: str) -> int:
+    """Return the id of the active user a token belongs to."""
+    with SessionLocal() as db:
+        user = get_user_from_token(token, db)
+        if not user.is_active:
+            raise HTTPException(status_code=400, detail="Inactive user")
+        return user.id
+
+@app.websocket("/ws")
+async def websocket_events(websocket: WebSocket, token: str = Query(...)):
+    """Push message and claim events to the connected user as JSON.
+
+    Browsers can't set headers on WebSocket requests, so the JWT from /login
+    is passed as ``?token=``. Events look like ``{"type": "message.created",
+    "data": {...}}``; sending ``ping`` gets ``pong`` back.
+    """
+    try:
+        user_id = await run_in_threadpool(resolve_websocket_user, token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    realtime_manager.connect(user_id, websocket)
+    try:
+        while True:
+            if await websocket.receive_text() == "ping":
+                await websocket.send_text("pong")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        realtime_manager.disconnect(user_id, websocket)
+
 # Review endpoints
 @app.post("/reviews", response_model=ReviewResponse)
 def create_review(
@@ -430,21 +899,68 @@ def create_review(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Create a review for a user."""
+    """Create a review for a user.
+
+    The reviewed user's rating totals are updated in the same transaction.
+    """
+    if review.reviewed_user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Cannot review yourself")
+    if db.get(User, review.reviewed_user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if review.food_post_id is not None and db.get(FoodPost, review.food_post_id) is None:
+        raise HTTPException(status_code=404, detail="Food post not found")
+    # unique_review can't catch these: NULL food_post_ids never collide
+    if review.food_post_id is None and db.query(Review.id).filter(
+        Review.reviewer_id == current_user.id,
+        Review.reviewed_user_id == review.reviewed_user_id,
+        Review.food_post_id.is_(None)
+    ).first() is not None:
+        raise HTTPException(status_code=400, detail="You have already reviewed this user")
+    
     db_review = Review(
         reviewer_id=current_user.id,
         **review.dict()
     )
     db.add(db_review)
-    db.commit()
-    db.refresh(db_review)
-    return db_review
+    try:
+        db.flush()
+        add_rating(db, review.reviewed_user_id, review.rating)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="You have already reviewed this user for this post")
+    return load_review(db, db_review.id)
+
+@app.get("/users/{user_id}/rating", response_model=UserRatingResponse)
+async def get_user_rating(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get a user's average rating and star histogram without loading their reviews."""
+    rating = await db.run_sync(get_rating, user_id)
+    if rating is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return rating
 
 @app.get("/users/{user_id}/reviews", response_model=List[ReviewResponse])
-def get_user_reviews(user_id: int, db: Session = Depends(get_db)):
-    """Get reviews for a specific user."""
-    reviews = db.query(Review).filter(Review.reviewed_user_id == user_id).all()
-    return reviews
+async def get_user_reviews(
+    user_id: int,
+    response: Response,
+    search: ReviewSearch = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get reviews for a specific user, newest first, with keyset pagination.
+
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` for the next page.
+    """
+    def load_reviews(session: Session) -> Tuple[List[ReviewResponse], Optional[str]]:
+        reviews, next_cursor = list_reviews(session, user_id, search.limit, search.cursor)
+        return [ReviewResponse.model_validate(review) for review in reviews], next_cursor
+    
+    try:
+        result, next_cursor = await db.run_sync(load_reviews)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return result
 
 # File upload endpoint
 @app.post("/upload", response_model=FileUploadResponse)
@@ -457,11 +973,12 @@ def upload_file(file: UploadFile = File(...)):
         )
     
     file_path = save_uploaded_file(file)
-    file_size = os.path.getsize(file_path)
+    file_size = storage.size(file_path)
     
     return FileUploadResponse(
         filename=file.filename,
         file_path=file_path,
+        file_url=storage.url(file_path),
         file_size=file_size
     )
 
@@ -0,0 +1,59 @@
+"""
+ASGI middleware for the FoodShare API.
+"""
+
+import os
+from fastapi import HTTPException
+from fastapi.staticfiles import StaticFiles
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from storage import CONTENT_ADDRESSED_NAME, IMMUTABLE_CACHE_CONTROL
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies larger than max_body_size with a 413.
+
+    A too-large Content-Length is refused before any of the body is read, and
+    chunked or mislabelled bodies are cut off as soon as the running total
+    passes the limit, so oversized uploads never finish spooling.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            response = JSONResponse(status_code=413, content={"detail": "Request body too large"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that lets clients and CDNs cache content-addressed files forever.
+
+    Any other file keeps the default revalidation behaviour.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if CONTENT_ADDRESSED_NAME.match(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -0,0 +1,172 @@
+-- Bring a database created from an older sql_init.sql (or by create_all) up to
+-- the current schema. sql_init.sql only runs on a fresh database and
+-- create_all never alters existing tables, so without this every query that
+-- loads a User fails on the missing unread_message_count column.
+--
+-- Safe to run more than once: every step checks information_schema first.
+--   mysql -u root -p foodshare < backend/migrations/001_upgrade_existing_schema.sql
+--
+-- Legacy messages are threaded into conversations, and rating totals built
+-- from existing reviews, by the API on its next startup.
+
+DROP PROCEDURE IF EXISTS foodshare_add_column;
+DROP PROCEDURE IF EXISTS foodshare_add_index;
+DROP PROCEDURE IF EXISTS foodshare_add_foreign_key;
+DROP PROCEDURE IF EXISTS foodshare_drop_index;
+
+DELIMITER //
+
+CREATE PROCEDURE foodshare_add_column(IN table_name_ VARCHAR(64), IN column_name_ VARCHAR(64), IN definition_ TEXT)
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = table_name_ AND COLUMN_NAME = column_name_
+    ) THEN
+        SET @ddl = CONCAT('ALTER TABLE ', table_name_, ' ADD COLUMN ', column_name_, ' ', definition_);
+        PREPARE statement_ FROM @ddl;
+        EXECUTE statement_;
+        DEALLOCATE PREPARE statement_;
+    END IF;
+END //
+
+-- definition_ is everything after ADD, e.g. 'INDEX name (a, b)' or 'UNIQUE KEY name (a, b)'
+CREATE PROCEDURE foodshare_add_index(IN table_name_ VARCHAR(64), IN index_name_ VARCHAR(64), IN definition_ TEXT)
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = table_name_ AND INDEX_NAME = index_name_
+    ) THEN
+        SET @ddl = CONCAT('ALTER TABLE ', table_name_, ' ADD ', definition_);
+        PREPARE statement_ FROM @ddl;
+        EXECUTE statement_;
+        DEALLOCATE PREPARE statement_;
+    END IF;
+END //
+
+-- Matched on the column and referenced table, as sql_init.sql leaves foreign keys unnamed
+CREATE PROCEDURE foodshare_add_foreign_key(IN table_name_ VARCHAR(64), IN column_name_ VARCHAR(64), IN referenced_table_ VARCHAR(64), IN definition_ TEXT)
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = table_name_ AND COLUMN_NAME = column_name_
+            AND REFERENCED_TABLE_NAME = referenced_table_
+    ) THEN
+        SET @ddl = CONCAT('ALTER TABLE ', table_name_, ' ADD ', definition_);
+        PREPARE statement_ FROM @ddl;
+        EXECUTE statement_;
+        DEALLOCATE PREPARE statement_;
+    END IF;
+END //
+
+CREATE PROCEDURE foodshare_drop_index(IN table_name_ VARCHAR(64), IN index_name_ VARCHAR(64))
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = table_name_ AND INDEX_NAME = index_name_
+    ) THEN
+        SET @ddl = CONCAT('ALTER TABLE ', table_name_, ' DROP INDEX ', index_name_);
+        PREPARE statement_ FROM @ddl;
+        EXECUTE statement_;
+        DEALLOCATE PREPARE statement_;
+    END IF;
+END //
+
+DELIMITER ;
+
+-- New columns on existing tables
+CALL foodshare_add_column('users', 'unread_message_count', 'INT NOT NULL DEFAULT 0 AFTER is_admin');
+CALL foodshare_add_column('food_posts', 'latitude', 'DOUBLE NULL AFTER pickup_location');
+CALL foodshare_add_column('food_posts', 'longitude', 'DOUBLE NULL AFTER latitude');
+CALL foodshare_add_column('food_posts', 'geohash', 'VARCHAR(12) NULL AFTER longitude');
+CALL foodshare_add_column('food_posts', 'claim_expires_at', 'TIMESTAMP NULL AFTER claimed_at');
+CALL foodshare_add_column('food_images', 'card_path', 'VARCHAR(255) NULL AFTER image_path');
+CALL foodshare_add_column('food_images', 'thumb_path', 'VARCHAR(255) NULL AFTER card_path');
+CALL foodshare_add_column('food_images', 'content_hash', 'CHAR(64) NULL AFTER thumb_path');
+CALL foodshare_add_column('messages', 'conversation_id', 'INT NULL AFTER food_post_id');
+
+-- New tables
+CREATE TABLE IF NOT EXISTS claim_waitlist (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    food_post_id INT NOT NULL,
+    user_id INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_claim_waitlist_post_user (food_post_id, user_id),
+    FOREIGN KEY (food_post_id) REFERENCES food_posts(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_low_id INT NOT NULL,
+    user_high_id INT NOT NULL,
+    food_post_id INT NULL,
+    post_key INT NOT NULL DEFAULT 0,
+    last_message_id INT NULL,
+    last_message_at TIMESTAMP NULL,
+    last_message_preview VARCHAR(200) NULL,
+    last_sender_id INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_conversations_pair_post (user_low_id, user_high_id, post_key),
+    FOREIGN KEY (user_low_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_high_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (food_post_id) REFERENCES food_posts(id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS conversation_participants (
+    conversation_id INT NOT NULL,
+    user_id INT NOT NULL,
+    unread_count INT NOT NULL DEFAULT 0,
+    last_message_at TIMESTAMP NULL,
+    last_read_at TIMESTAMP NULL,
+    PRIMARY KEY (conversation_id, user_id),
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS user_ratings (
+    user_id INT PRIMARY KEY,
+    rating_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_1_count INT NOT NULL DEFAULT 0,
+    rating_2_count INT NOT NULL DEFAULT 0,
+    rating_3_count INT NOT NULL DEFAULT 0,
+    rating_4_count INT NOT NULL DEFAULT 0,
+    rating_5_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Indexes, as in sql_init.sql
+CALL foodshare_add_index('food_posts', 'idx_food_posts_created_at_id', 'INDEX idx_food_posts_created_at_id (created_at, id)');
+CALL foodshare_add_index('food_posts', 'idx_food_posts_geohash', 'INDEX idx_food_posts_geohash (geohash)');
+CALL foodshare_add_index('food_posts', 'idx_food_posts_available_created', 'INDEX idx_food_posts_available_created (is_available, created_at, id)');
+CALL foodshare_add_index('food_posts', 'idx_food_posts_available_claimed_created', 'INDEX idx_food_posts_available_claimed_created (is_available, is_claimed, created_at, id)');
+CALL foodshare_add_index('food_posts', 'idx_food_posts_category_available_created', 'INDEX idx_food_posts_category_available_created (category_id, is_available, created_at, id)');
+CALL foodshare_add_index('food_posts', 'idx_food_posts_claim_expires', 'INDEX idx_food_posts_claim_expires (is_claimed, claim_expires_at)');
+CALL foodshare_add_index('food_posts', 'idx_food_posts_available_expiry', 'INDEX idx_food_posts_available_expiry (is_available, expiry_date)');
+CALL foodshare_add_index('food_posts', 'ft_food_posts_title_description', 'FULLTEXT INDEX ft_food_posts_title_description (title, description)');
+CALL foodshare_add_index('users', 'idx_users_state_city', 'INDEX idx_users_state_city (state, city)');
+CALL foodshare_add_index('users', 'idx_users_city', 'INDEX idx_users_city (city)');
+CALL foodshare_add_index('claim_waitlist', 'idx_claim_waitlist_post_queue', 'INDEX idx_claim_waitlist_post_queue (food_post_id, created_at, id)');
+CALL foodshare_add_index('food_images', 'idx_food_images_post_primary', 'INDEX idx_food_images_post_primary (food_post_id, is_primary)');
+CALL foodshare_add_index('food_images', 'idx_food_images_content_hash', 'INDEX idx_food_images_content_hash (content_hash)');
+CALL foodshare_add_index('messages', 'idx_messages_conversation_created', 'INDEX idx_messages_conversation_created (conversation_id, created_at, id)');
+CALL foodshare_add_index('messages', 'idx_messages_conversation_unread', 'INDEX idx_messages_conversation_unread (conversation_id, receiver_id, is_read)');
+CALL foodshare_add_index('conversation_participants', 'idx_conversation_participants_inbox', 'INDEX idx_conversation_participants_inbox (user_id, last_message_at, conversation_id)');
+CALL foodshare_add_index('reviews', 'idx_reviews_reviewed_user_created', 'INDEX idx_reviews_reviewed_user_created (reviewed_user_id, created_at, id)');
+-- Fails if the table already holds duplicate reviews; remove those first
+CALL foodshare_add_index('reviews', 'unique_review', 'UNIQUE KEY unique_review (reviewer_id, reviewed_user_id, food_post_id)');
+
+-- After its index exists, so MySQL doesn't add another one for the key
+CALL foodshare_add_foreign_key('messages', 'conversation_id', 'conversations',
+    'FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE');
+
+-- Single-column indexes the composite feed indexes above replace
+CALL foodshare_drop_index('food_posts', 'idx_food_posts_category_id');
+CALL foodshare_drop_index('food_posts', 'idx_food_posts_is_available');
+CALL foodshare_drop_index('food_posts', 'idx_food_posts_created_at');
+
+DROP PROCEDURE foodshare_add_column;
+DROP PROCEDURE foodshare_add_index;
+DROP PROCEDURE foodshare_add_foreign_key;
+DROP PROCEDURE foodshare_drop_index;
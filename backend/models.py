@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Date, Time, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, Float, String, Text, Boolean, DateTime, Date, Time, ForeignKey, CheckConstraint, Index, UniqueConstraint
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 
@@ -21,6 +21,8 @@ class User(Base):
     bio = Column(Text)
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
+    # Messages received and not yet read, kept in step by conversations.py
+    unread_message_count = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -30,6 +32,11 @@ class User(Base):
     received_messages = relationship("Message", foreign_keys="Message.receiver_id", back_populates="receiver")
     reviews_given = relationship("Review", foreign_keys="Review.reviewer_id", back_populates="reviewer")
     reviews_received = relationship("Review", foreign_keys="Review.reviewed_user_id", back_populates="reviewed_user")
+    
+    __table_args__ = (
+        Index("idx_users_state_city", "state", "city"),
+        Index("idx_users_city", "city"),
+    )
 
 class Category(Base):
     __tablename__ = "categories"
@@ -54,12 +61,17 @@ class FoodPost(Base):
     quantity = Column(String(100))
     expiry_date = Column(Date)
     pickup_location = Column(Text, nullable=False)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    geohash = Column(String(12), index=True)
     pickup_time_start = Column(Time)
     pickup_time_end = Column(Time)
     is_available = Column(Boolean, default=True)
     is_claimed = Column(Boolean, default=False)
     claimed_by = Column(Integer, ForeignKey("users.id"))
     claimed_at = Column(DateTime)
+    # A claim not picked up by then is released to the next person on the waitlist
+    claim_expires_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -69,6 +81,17 @@ class FoodPost(Base):
     claimed_by_user = relationship("User", foreign_keys=[claimed_by])
     images = relationship("FoodImage", back_populates="food_post", cascade="all, delete-orphan")
     messages = relationship("Message", back_populates="food_post")
+    waitlist = relationship("ClaimWaitlist", back_populates="food_post", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("idx_food_posts_created_at_id", "created_at", "id"),
+        Index("idx_food_posts_available_created", "is_available", "created_at", "id"),
+        Index("idx_food_posts_available_claimed_created", "is_available", "is_claimed", "created_at", "id"),
+        Index("idx_food_posts_category_available_created", "category_id", "is_available", "created_at", "id"),
+        Index("idx_food_posts_claim_expires", "is_claimed", "claim_expires_at"),
+        Index("idx_food_posts_available_expiry", "is_available", "expiry_date"),
+        Index("ft_food_posts_title_description", "title", "description", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
 
 class FoodImage(Base):
     __tablename__ = "food_images"
@@ -76,11 +99,36 @@ class FoodImage(Base):
     id = Column(Integer, primary_key=True, index=True)
     food_post_id = Column(Integer, ForeignKey("food_posts.id"), nullable=False)
     image_path = Column(String(255), nullable=False)
+    card_path = Column(String(255))
+    thumb_path = Column(String(255))
+    # sha256 of the uploaded bytes; rows sharing it share the same files on disk
+    content_hash = Column(String(64), index=True)
     is_primary = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     food_post = relationship("FoodPost", back_populates="images")
+    
+    __table_args__ = (
+        Index("idx_food_images_post_primary", "food_post_id", "is_primary"),
+    )
+
+class ClaimWaitlist(Base):
+    __tablename__ = "claim_waitlist"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    food_post_id = Column(Integer, ForeignKey("food_posts.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    food_post = relationship("FoodPost", back_populates="waitlist")
+    user = relationship("User")
+    
+    __table_args__ = (
+        UniqueConstraint("food_post_id", "user_id", name="uq_claim_waitlist_post_user"),
+        Index("idx_claim_waitlist_post_queue", "food_post_id", "created_at", "id"),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
@@ -89,6 +137,7 @@ class Message(Base):
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     food_post_id = Column(Integer, ForeignKey("food_posts.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id"))
     subject = Column(String(200))
     message = Column(Text, nullable=False)
     is_read = Column(Boolean, default=False)
@@ -98,6 +147,59 @@ class Message(Base):
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_messages")
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_messages")
     food_post = relationship("FoodPost", back_populates="messages")
+    conversation = relationship("Conversation", back_populates="messages")
+    
+    __table_args__ = (
+        Index("idx_messages_conversation_created", "conversation_id", "created_at", "id"),
+        Index("idx_messages_conversation_unread", "conversation_id", "receiver_id", "is_read"),
+    )
+
+class Conversation(Base):
+    """A message thread between two users, optionally about one food post."""
+    __tablename__ = "conversations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # The pair is stored in id order so each thread has exactly one key
+    user_low_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_high_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    food_post_id = Column(Integer, ForeignKey("food_posts.id"))
+    # food_post_id, or 0 for general threads, so the unique key also covers those
+    post_key = Column(Integer, nullable=False, default=0)
+    last_message_id = Column(Integer)
+    last_message_at = Column(DateTime)
+    last_message_preview = Column(String(200))
+    last_sender_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    user_low = relationship("User", foreign_keys=[user_low_id])
+    user_high = relationship("User", foreign_keys=[user_high_id])
+    food_post = relationship("FoodPost")
+    participants = relationship("ConversationParticipant", back_populates="conversation", cascade="all, delete-orphan")
+    messages = relationship("Message", back_populates="conversation")
+    
+    __table_args__ = (
+        UniqueConstraint("user_low_id", "user_high_id", "post_key", name="uq_conversations_pair_post"),
+    )
+
+class ConversationParticipant(Base):
+    """One user's side of a conversation: their unread count and inbox position."""
+    __tablename__ = "conversation_participants"
+    
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+    # Copy of the conversation's last_message_at, so the inbox is one range scan
+    last_message_at = Column(DateTime)
+    last_read_at = Column(DateTime)
+    
+    # Relationships
+    conversation = relationship("Conversation", back_populates="participants")
+    user = relationship("User")
+    
+    __table_args__ = (
+        Index("idx_conversation_participants_inbox", "user_id", "last_message_at", "conversation_id"),
+    )
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -117,4 +219,21 @@ class Review(Base):
     
     __table_args__ = (
         CheckConstraint("rating >= 1 AND rating <= 5", name="check_rating_range"),
+        UniqueConstraint("reviewer_id", "reviewed_user_id", "food_post_id", name="unique_review"),
+        Index("idx_reviews_reviewed_user_created", "reviewed_user_id", "created_at", "id"),
     )
+
+class UserRating(Base):
+    """Running totals of the reviews a user has received, kept by ratings.py."""
+    __tablename__ = "user_ratings"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    # Histogram: number of reviews with each star rating
+    rating_1_count = Column(Integer, nullable=False, default=0)
+    rating_2_count = Column(Integer, nullable=False, default=0)
+    rating_3_count = Column(Integer, nullable=False, default=0)
+    rating_4_count = Column(Integer, nullable=False, default=0)
+    rating_5_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
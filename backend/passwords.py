@@ -0,0 +1,111 @@
+"""
+Password hashing run in a bounded process pool.
+
+bcrypt deliberately burns 100-300 ms of CPU per call. Running it in worker
+processes keeps it off the event loop and the request threadpool, and a cap on
+pending jobs makes a login burst fail fast with 503s instead of stalling every
+other endpoint.
+"""
+
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# bcrypt cost factor; hashes below it are upgraded on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(PASSWORD_WORKERS * 4)))
+PASSWORD_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_QUEUE_TIMEOUT", "2"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+def hash_password(password: str) -> str:
+    """Hash a password with the configured cost factor."""
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash."""
+    return pwd_context.verify(plain_password, hashed_password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Check whether a hash uses an outdated scheme or cost factor."""
+    return pwd_context.needs_update(hashed_password)
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many password jobs are already waiting."""
+
+class PasswordPool:
+    """Process pool for password work with a cap on pending jobs."""
+
+    def __init__(self, max_workers: int, max_pending: int, queue_timeout: float):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so importing this module never starts processes. By
+        # then the server runs threads, and forking a threaded process can
+        # deadlock the child, so workers come from a forkserver (or spawn)
+        if self._executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return self._executor
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        """Run func(*args) in a worker process, waiting at most queue_timeout for a slot."""
+        # asyncio primitives belong to one loop; there is one per worker process
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        semaphore = self._semaphore
+
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning(f"Password pool saturated ({self.pending} pending), rejecting job")
+            raise PasswordPoolBusy()
+
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        """Return queue depth and throughput counters."""
+        return {
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_pool = PasswordPool(PASSWORD_WORKERS, PASSWORD_MAX_PENDING, PASSWORD_QUEUE_TIMEOUT)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Check that list endpoints run the same number of SQL statements at any page size.
+
+A statement count that grows with ``limit`` means rows are lazy-loading
+relationships one by one (see loaders.py). The script seeds a temporary
+SQLite database in which every row has its own users, food post and
+category, so a lazy load can't hide behind the session's identity map, and
+runs the app in-process against it:
+    python query_budget.py
+    python query_budget.py --sizes 1 10 50
+
+count_statements and check_page_scaling can also be used on their own with
+a TestClient.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence
+from sqlalchemy import event
+
+# Statements behind a GET /food-posts page of any size: the page itself, its
+# flagged primary images, and the first images of posts without one
+FOOD_POSTS_BUDGET = 3
+
+@contextmanager
+def count_statements() -> Iterator[List[str]]:
+    """Collect every SQL statement either engine executes inside the block."""
+    from database import engine, async_engine
+
+    statements = []
+    engines = [engine, async_engine.sync_engine]
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for sync_engine in engines:
+        event.listen(sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for sync_engine in engines:
+            event.remove(sync_engine, "before_cursor_execute", record)
+
+def check_page_scaling(
+    client, path: str, sizes: Sequence[int] = (1, 20), headers: Optional[dict] = None, allowance: int = 0
+) -> Dict[int, int]:
+    """Count the statements behind GET path.format(limit=size) for each size.
+
+    Each size is requested once beforehand so caches are warm. Raises
+    AssertionError if the largest page runs more than allowance statements
+    beyond the smallest, or if the pages didn't grow (too little data to
+    tell); returns the counts otherwise.
+    """
+    counts, rows = {}, {}
+    for size in sizes:
+        client.get(path.format(limit=size), headers=headers).raise_for_status()
+        with count_statements() as statements:
+            response = client.get(path.format(limit=size), headers=headers)
+            response.raise_for_status()
+        counts[size] = len(statements)
+        rows[size] = len(response.json())
+
+    smallest, largest = min(sizes), max(sizes)
+    if rows[largest] <= rows[smallest]:
+        raise AssertionError(f"GET {path}: pages didn't grow with the page size, rows {rows}")
+    if counts[largest] - counts[smallest] > allowance:
+        raise AssertionError(f"GET {path}: statement count grows with page size: {counts} for rows {rows}")
+    return counts
+
+def check_statement_budget(client, path: str, budget: int, sizes: Sequence[int] = (1, 20), headers: Optional[dict] = None) -> Dict[int, int]:
+    """Count the statements behind GET path.format(limit=size) for each size.
+
+    Raises AssertionError if any size runs more than budget statements;
+    returns the counts otherwise.
+    """
+    counts = {}
+    for size in sizes:
+        client.get(path.format(limit=size), headers=headers).raise_for_status()
+        with count_statements() as statements:
+            client.get(path.format(limit=size), headers=headers).raise_for_status()
+        counts[size] = len(statements)
+
+    if max(counts.values()) > budget:
+        raise AssertionError(f"GET {path}: over its budget of {budget} statements: {counts}")
+    return counts
+
+def seed(db, rows: int, password_hash: str) -> dict:
+    """Fill an empty database for the checks and commit. Returns the viewer's username and a thread id.
+
+    Row i of every listing has its own author, category, food post and
+    correspondent. Every other post, the newest included, has no image flagged
+    as primary, so every page also takes the first-image fallback. The
+    viewer's thread with the first correspondent also gets rows older
+    messages, for the thread listing.
+    """
+    from models import Category, FoodImage, FoodPost, Message, Review, User
+    from conversations import backfill_conversations
+    from ratings import backfill_ratings
+
+    viewer = User(username="viewer", email="viewer@example.com", password_hash=password_hash, is_active=True)
+    db.add(viewer)
+    now = datetime.utcnow()
+    for i in range(rows):
+        created_at = now - timedelta(minutes=i)
+        author = User(username=f"author{i}", email=f"author{i}@example.com", password_hash=password_hash)
+        correspondent = User(username=f"correspondent{i}", email=f"correspondent{i}@example.com", password_hash=password_hash)
+        category = Category(name=f"Category {i}", icon="📦")
+        post = FoodPost(
+            title=f"Post {i}", description="Query budget check", pickup_location="Main St",
+            user=author, category=category, created_at=created_at
+        )
+        post.images = [FoodImage(image_path=f"uploads/{i}.jpg", is_primary=i % 2 == 1)]
+        db.add_all([author, correspondent, category, post])
+        db.add(Message(sender=correspondent, receiver=viewer, food_post=post, message=f"Message {i}", created_at=created_at))
+        db.add(Review(reviewer=correspondent, reviewed_user=viewer, food_post=post, rating=i % 5 + 1, created_at=created_at))
+        if i == 0:
+            first_post, first_correspondent = post, correspondent
+    for i in range(rows):
+        db.add(Message(
+            sender=first_correspondent, receiver=viewer, food_post=first_post,
+            message=f"Earlier message {i}", created_at=now - timedelta(days=1, minutes=i)
+        ))
+    db.commit()
+
+    backfill_conversations(db)
+    backfill_ratings(db)
+    return {"username": viewer.username, "conversation_id": first_post.messages[0].conversation_id}
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that list endpoints don't lazy-load per row.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 20], help="page sizes to compare (default: 1 20)")
+    parser.add_argument("--allowance", type=int, default=0, help="extra statements allowed on the largest page (default: 0)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="query_budget_", ignore_cleanup_errors=True) as work_dir:
+        sys.exit(run_checks(work_dir, args.sizes, args.allowance))
+
+def run_checks(work_dir: str, sizes: Sequence[int], allowance: int) -> int:
+    """Seed a database in work_dir, check every list endpoint and return the exit status."""
+    # Set up before the app's modules create their engines
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'query_budget.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["LOCAL_STORAGE_ROOT"] = work_dir
+    os.environ["BCRYPT_ROUNDS"] = "4"
+
+    from fastapi.testclient import TestClient
+    from database import SessionLocal, engine
+    from models import Base
+    from passwords import hash_password
+
+    password = "query-budget"
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        seeded = seed(db, max(sizes), hash_password(password))
+
+    from main import app
+
+    client = TestClient(app)
+    response = client.post("/login", json={"username": seeded["username"], "password": password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    user_id = client.get("/me", headers=headers).json()["id"]
+
+    paths = [
+        "/food-posts?limit={limit}",
+        "/messages?limit={limit}",
+        "/conversations?limit={limit}",
+        f"/conversations/{seeded['conversation_id']}/messages?limit={{limit}}",
+        f"/users/{user_id}/reviews?limit={{limit}}",
+    ]
+
+    failed = False
+    for path in paths:
+        try:
+            counts = check_page_scaling(client, path, sizes, headers, allowance)
+            print(f"✅ GET {path}: {counts}")
+        except AssertionError as e:
+            failed = True
+            print(f"❌ {e}")
+
+    try:
+        counts = check_statement_budget(client, "/food-posts?limit={limit}", FOOD_POSTS_BUDGET, sizes)
+        print(f"✅ GET /food-posts within {FOOD_POSTS_BUDGET} statements: {counts}")
+    except AssertionError as e:
+        failed = True
+        print(f"❌ {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Check that each documented feed filter is answered from one of the feed indexes.
+
+Runs the real feed query builder (list_food_posts) for each filter
+combination, captures the SELECT it sends and EXPLAINs it on the configured
+database (EXPLAIN QUERY PLAN on SQLite, EXPLAIN on MySQL):
+    python query_plans.py
+
+Exits 1 if any combination reads food_posts with a full scan or through an
+index other than the idx_food_posts_* feed indexes below.
+"""
+
+import sys
+from typing import List, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+from schemas import FoodPostSearch
+
+FEED_INDEXES = (
+    "idx_food_posts_created_at_id",
+    "idx_food_posts_available_created",
+    "idx_food_posts_available_claimed_created",
+    "idx_food_posts_category_available_created",
+)
+
+# The filter combinations the feed indexes are meant to cover
+FEED_FILTERS = [
+    {},
+    {"is_available": True, "is_claimed": False},
+    {"is_claimed": True},
+    {"category_id": 1},
+    {"category_id": 1, "is_claimed": False},
+    {"city": "Springfield"},
+    {"state": "IL"},
+    {"city": "Springfield", "state": "IL"},
+]
+
+def explain_feed_query(db: Session, search: FoodPostSearch) -> List[str]:
+    """Return the plan of the page query list_food_posts runs for search, one line per step."""
+    from main import list_food_posts
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        list_food_posts(db, search)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    statement, parameters = statements[0]
+    connection = db.connection()
+    if connection.dialect.name == "sqlite":
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    return [
+        f"{row['table']}: type={row['type']} key={row['key']}"
+        for row in (r._mapping for r in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters))
+    ]
+
+def check_feed_plan(plan: List[str]) -> Tuple[bool, str]:
+    """Whether a plan reads food_posts through a feed index, and the step that decided it."""
+    for step in plan:
+        # SQLite: "SEARCH food_posts USING INDEX ...", MySQL: "food_posts: type=ref key=..."
+        if step.startswith(("SEARCH food_posts", "SCAN food_posts", "food_posts:")):
+            uses_index = any(index in step for index in FEED_INDEXES) and "type=ALL" not in step
+            return uses_index, step
+    return False, "food_posts not found in plan"
+
+def main():
+    failed = False
+    db = SessionLocal()
+    try:
+        for filters in FEED_FILTERS:
+            plan = explain_feed_query(db, FoodPostSearch(**filters))
+            ok, step = check_feed_plan(plan)
+            failed = failed or not ok
+            print(f"{'✅' if ok else '❌'} {filters or 'default feed'}: {step}")
+            db.rollback()
+    finally:
+        db.close()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
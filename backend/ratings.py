@@ -0,0 +1,118 @@
+"""
+User ratings from running totals instead of loading reviews.
+
+Each review adds to its user's UserRating row (count, sum and a per-star
+histogram) in the transaction that stores it, so a rating is one primary key
+lookup however many reviews the user has. Review listings are paged by
+(created_at, id) with the REVIEW_RESPONSE loader profile.
+"""
+
+import logging
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import Review, User, UserRating
+from utils import encode_cursor, decode_cursor
+from loaders import REVIEW_RESPONSE, attach_primary_images
+
+logger = logging.getLogger(__name__)
+
+def histogram_column(rating: int):
+    return getattr(UserRating, f"rating_{rating}_count")
+
+def add_rating(db: Session, user_id: int, rating: int) -> None:
+    """Count one more review of user_id. Does not commit.
+
+    Totals are incremented in SQL, so concurrent reviews don't lose updates.
+    The first review creates the row; losing that race to another first
+    review falls back to the increment.
+    """
+    column = histogram_column(rating)
+
+    def increment() -> bool:
+        return db.execute(
+            update(UserRating)
+            .where(UserRating.user_id == user_id)
+            .values({
+                UserRating.rating_count: UserRating.rating_count + 1,
+                UserRating.rating_sum: UserRating.rating_sum + rating,
+                column: column + 1,
+            })
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    if increment():
+        return
+    try:
+        with db.begin_nested():
+            db.add(UserRating(user_id=user_id, rating_count=1, rating_sum=rating, **{column.key: 1}))
+    except IntegrityError:
+        increment()
+
+def get_rating(db: Session, user_id: int) -> Optional[dict]:
+    """Return a user's rating summary, or None if the user doesn't exist."""
+    rating = db.get(UserRating, user_id)
+    if rating is None:
+        if db.get(User, user_id) is None:
+            return None
+        rating = UserRating(user_id=user_id, rating_count=0, rating_sum=0)
+
+    return {
+        "user_id": user_id,
+        "rating_count": rating.rating_count,
+        "average_rating": round(rating.rating_sum / rating.rating_count, 2) if rating.rating_count else None,
+        "histogram": {stars: getattr(rating, f"rating_{stars}_count") or 0 for stars in range(1, 6)},
+    }
+
+def list_reviews(db: Session, user_id: int, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Review], Optional[str]]:
+    """Return one page of a user's reviews, newest first, and the next cursor."""
+    query = db.query(Review).options(*REVIEW_RESPONSE).filter(Review.reviewed_user_id == user_id)
+
+    if cursor:
+        created_at, review_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Review.created_at < created_at,
+            and_(Review.created_at == created_at, Review.id < review_id)
+        ))
+
+    reviews = query.order_by(Review.created_at.desc(), Review.id.desc()).limit(limit).all()
+    attach_primary_images(db, [review.food_post for review in reviews])
+
+    next_cursor = None
+    if reviews and len(reviews) == limit:
+        next_cursor = encode_cursor(reviews[-1].created_at, reviews[-1].id)
+    return reviews, next_cursor
+
+def backfill_ratings(db: Session) -> int:
+    """Build rating totals from existing reviews if none have been kept yet, and commit.
+
+    Every worker runs this at startup. If another one commits its totals
+    first, the primary keys collide and this one rolls back and leaves them.
+    Returns the number of users whose totals were created.
+    """
+    if db.query(UserRating.user_id).first() is not None:
+        return 0
+
+    totals = {}
+    for user_id, rating, count in db.query(
+        Review.reviewed_user_id, Review.rating, func.count(Review.id)
+    ).filter(Review.rating.isnot(None)).group_by(Review.reviewed_user_id, Review.rating):
+        row = totals.setdefault(user_id, UserRating(
+            user_id=user_id, rating_count=0, rating_sum=0,
+            rating_1_count=0, rating_2_count=0, rating_3_count=0, rating_4_count=0, rating_5_count=0
+        ))
+        row.rating_count += count
+        row.rating_sum += rating * count
+        setattr(row, f"rating_{rating}_count", count)
+
+    db.add_all(totals.values())
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.info("Rating totals were built by another worker")
+        return 0
+    if totals:
+        logger.info(f"Built rating totals for {len(totals)} users from existing reviews")
+    return len(totals)
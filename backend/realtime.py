@@ -0,0 +1,181 @@
+"""
+Real-time push of message and claim events over WebSockets.
+
+Each worker process keeps the sockets of its own connected users. Events are
+published to a broker and every worker delivers them to whichever of the
+target users are connected to it:
+
+- "memory" (default): delivery within the publishing process, for a single
+  worker.
+- "redis": Redis pub/sub on REALTIME_CHANNEL, for several workers or
+  replicas. Any Redis-compatible server works.
+
+Pushes are best effort. A client that was offline catches up through the
+regular endpoints.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+from fastapi import WebSocket, status
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+REALTIME_BROKER = os.getenv("REALTIME_BROKER", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REALTIME_CHANNEL = os.getenv("REALTIME_CHANNEL", "foodshare:events")
+# Seconds a socket gets to accept an event before it is dropped as too slow
+REALTIME_SEND_TIMEOUT = float(os.getenv("REALTIME_SEND_TIMEOUT", "2"))
+
+Handler = Callable[[dict], Awaitable[None]]
+
+class ConnectionManager:
+    """Open WebSockets in this process, by user id."""
+
+    def __init__(self):
+        self._connections: Dict[int, Set[WebSocket]] = {}
+        self.delivered = 0
+        self.dropped = 0
+
+    def connect(self, user_id: int, websocket: WebSocket) -> None:
+        self._connections.setdefault(user_id, set()).add(websocket)
+
+    def disconnect(self, user_id: int, websocket: WebSocket) -> None:
+        sockets = self._connections.get(user_id)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del self._connections[user_id]
+
+    async def deliver(self, envelope: dict) -> None:
+        """Send an envelope's event to every local socket of its target users.
+
+        Sockets are written to concurrently, each with REALTIME_SEND_TIMEOUT,
+        so a slow or half-dead client can't hold up the others or the broker
+        listener for longer than that. Sockets that fail or time out are
+        dropped and closed; their client reconnects and catches up.
+        """
+        targets = [
+            (user_id, websocket)
+            for user_id in set(envelope["user_ids"])
+            for websocket in list(self._connections.get(user_id, ()))
+        ]
+        await asyncio.gather(*(self._send(user_id, websocket, envelope["event"]) for user_id, websocket in targets))
+
+    async def _send(self, user_id: int, websocket: WebSocket, event: dict) -> None:
+        try:
+            await asyncio.wait_for(websocket.send_json(event), timeout=REALTIME_SEND_TIMEOUT)
+            self.delivered += 1
+        except Exception:
+            self.dropped += 1
+            self.disconnect(user_id, websocket)
+            try:
+                await asyncio.wait_for(websocket.close(code=status.WS_1013_TRY_AGAIN_LATER), timeout=REALTIME_SEND_TIMEOUT)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._connections),
+            "sockets": sum(len(sockets) for sockets in self._connections.values()),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+class Broker:
+    """Fans published envelopes out to the handler of every subscribed process."""
+
+    async def start(self, handler: Handler) -> None:
+        raise NotImplementedError
+
+    async def publish(self, envelope: dict) -> None:
+        raise NotImplementedError
+
+    async def stop(self) -> None:
+        pass
+
+class InMemoryBroker(Broker):
+    """Delivers straight to this process; enough when there is one worker."""
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler) -> None:
+        self._handler = handler
+
+    async def publish(self, envelope: dict) -> None:
+        if self._handler is not None:
+            await self._handler(envelope)
+
+class RedisBroker(Broker):
+    """Redis pub/sub, so an event published by one worker reaches all of them."""
+
+    def __init__(self, url: str = REDIS_URL, channel: str = REALTIME_CHANNEL, client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler) -> None:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        self._task = asyncio.get_running_loop().create_task(self._listen(pubsub, handler))
+
+    async def _listen(self, pubsub, handler: Handler) -> None:
+        try:
+            while True:
+                try:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        await handler(json.loads(message["data"]))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Realtime subscriber error: {str(e)}")
+                    await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+    async def publish(self, envelope: dict) -> None:
+        await self.client.publish(self.channel, json.dumps(envelope))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.client.aclose()
+
+def create_broker(name: str = REALTIME_BROKER) -> Broker:
+    """Build the broker named by REALTIME_BROKER."""
+    if name == "memory":
+        return InMemoryBroker()
+    if name == "redis":
+        logger.info(f"Using Redis realtime broker: {REDIS_URL} ({REALTIME_CHANNEL})")
+        return RedisBroker()
+    raise ValueError(f"Unknown REALTIME_BROKER: {name}")
+
+manager = ConnectionManager()
+broker = create_broker()
+
+async def publish_event(user_ids: Iterable[int], event_type: str, data: dict) -> None:
+    """Push {"type": event_type, "data": data} to the given users, wherever they are connected.
+
+    None entries (e.g. a post with no claimant) are skipped.
+    """
+    try:
+        envelope = {
+            "user_ids": sorted({user_id for user_id in user_ids if user_id is not None}),
+            "event": {"type": event_type, "data": jsonable_encoder(data)},
+        }
+        await broker.publish(envelope)
+    except Exception as e:
+        logger.error(f"Failed to publish {event_type} event: {str(e)}")
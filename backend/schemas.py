@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, validator
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, computed_field, validator
+from typing import Dict, Optional, List
 from datetime import datetime, date, time
+from storage import storage
 
 # User Schemas
 class UserBase(BaseModel):
@@ -71,8 +72,26 @@ class FoodImageCreate(FoodImageBase):
 
 class FoodImageResponse(FoodImageBase):
     id: int
+    card_path: Optional[str] = None
+    thumb_path: Optional[str] = None
     created_at: datetime
     
+    # Where clients fetch each variant from: the /uploads mount or a (presigned) bucket URL
+    @computed_field
+    @property
+    def image_url(self) -> str:
+        return storage.url(self.image_path)
+    
+    @computed_field
+    @property
+    def card_url(self) -> Optional[str]:
+        return storage.url(self.card_path) if self.card_path else None
+    
+    @computed_field
+    @property
+    def thumb_url(self) -> Optional[str]:
+        return storage.url(self.thumb_path) if self.thumb_path else None
+    
     class Config:
         from_attributes = True
 
@@ -108,6 +127,9 @@ class FoodPostResponse(FoodPostBase):
     is_claimed: bool
     claimed_by: Optional[int] = None
     claimed_at: Optional[datetime] = None
+    claim_expires_at: Optional[datetime] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     created_at: datetime
     updated_at: datetime
     user: UserResponse
@@ -126,6 +148,9 @@ class FoodPostListResponse(BaseModel):
     pickup_location: str
     is_available: bool
     is_claimed: bool
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    distance_km: Optional[float] = None
     created_at: datetime
     user: UserResponse
     category: Optional[CategoryResponse] = None
@@ -156,6 +181,24 @@ class MessageResponse(MessageBase):
     class Config:
         from_attributes = True
 
+# Conversation Schemas
+class ConversationResponse(BaseModel):
+    id: int
+    food_post_id: Optional[int] = None
+    other_user: UserResponse
+    last_message_id: Optional[int] = None
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
+    last_sender_id: Optional[int] = None
+    unread_count: int = 0
+
+class UnreadCount(BaseModel):
+    unread_messages: int
+
+class MarkReadResponse(BaseModel):
+    marked_read: int
+    unread_messages: int
+
 # Review Schemas
 class ReviewBase(BaseModel):
     reviewed_user_id: int
@@ -183,6 +226,28 @@ class ReviewResponse(ReviewBase):
     class Config:
         from_attributes = True
 
+class ReviewSearch(BaseModel):
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = None
+
+class UserRatingResponse(BaseModel):
+    user_id: int
+    rating_count: int
+    average_rating: Optional[float] = None
+    histogram: Dict[int, int]  # stars -> number of reviews
+
+# Claim Schemas
+class ClaimResponse(BaseModel):
+    message: str
+    claim_expires_at: Optional[datetime] = None
+
+class WaitlistStatus(BaseModel):
+    food_post_id: int
+    is_claimer: bool
+    position: Optional[int] = None  # 1 = next in line
+    waiting: int
+    claim_expires_at: Optional[datetime] = None
+
 # Token Schemas
 class Token(BaseModel):
     access_token: str
@@ -190,6 +255,7 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    user_id: Optional[int] = None
 
 # Search and Filter Schemas
 class FoodPostSearch(BaseModel):
@@ -198,15 +264,24 @@ class FoodPostSearch(BaseModel):
     city: Optional[str] = None
     state: Optional[str] = None
     is_available: Optional[bool] = True
+    is_claimed: Optional[bool] = None
+    near: Optional[str] = None
+    radius_km: float = 5.0
     limit: int = 20
     offset: int = 0
+    cursor: Optional[str] = None
 
 class MessageSearch(BaseModel):
     limit: int = 20
     offset: int = 0
 
+class ConversationSearch(BaseModel):
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = None
+
 # Upload Schema
 class FileUploadResponse(BaseModel):
     filename: str
     file_path: str
+    file_url: str
     file_size: int
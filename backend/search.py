@@ -0,0 +1,96 @@
+"""
+Full-text search for food posts.
+
+MySQL uses the FULLTEXT index on food_posts(title, description) declared in
+sql_init.sql and models.py. SQLite (the local dev database) uses an FTS5
+shadow table kept in sync with food_posts by triggers. Any other backend
+falls back to the old LIKE scan.
+"""
+
+import logging
+from typing import Optional, Tuple
+from sqlalchemy import column, func, literal_column, table, text
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query, Session
+from models import FoodPost
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "food_posts_fts"
+
+# External-content FTS5 table: stores only the index, reads rows from food_posts
+SQLITE_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, content='food_posts', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON food_posts BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON food_posts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description ON food_posts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+fts_table = table(FTS_TABLE, column("rowid"), column(FTS_TABLE))
+
+def init_search_index(engine: Engine) -> None:
+    """Create the SQLite FTS5 shadow table and its sync triggers if missing."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    with engine.begin() as conn:
+        tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        if "food_posts" not in tables:
+            logger.warning("food_posts table not found, skipping full-text index setup")
+            return
+
+        created = FTS_TABLE not in tables
+        for statement in SQLITE_FTS_DDL:
+            conn.execute(text(statement))
+
+        # Index rows that existed before the shadow table did
+        if created:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            logger.info(f"Built {FTS_TABLE} full-text index")
+
+def _fts5_query(search_term: str) -> str:
+    """Quote each word so user input can't be parsed as FTS5 query syntax."""
+    tokens = search_term.split()
+    return " ".join('"{}"'.format(token.replace('"', '""')) for token in tokens)
+
+def apply_text_search(db: Session, query: Query, search_term: str) -> Tuple[Query, Optional[object]]:
+    """Filter a FoodPost query by search_term.
+
+    Returns the filtered query and an expression to ORDER BY for best-first
+    relevance, or None when the backend can't rank results.
+    """
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "mysql":
+        relevance = match(FoodPost.title, FoodPost.description, against=search_term)
+        return query.filter(relevance > 0), relevance.desc()
+
+    if dialect == "sqlite":
+        fts_query = _fts5_query(search_term)
+        if not fts_query:
+            return query, None
+        query = query.join(fts_table, fts_table.c.rowid == FoodPost.id).filter(
+            fts_table.c[FTS_TABLE].op("MATCH")(fts_query)
+        )
+        # bm25() is lower for better matches
+        return query, func.bm25(literal_column(FTS_TABLE)).asc()
+
+    query = query.filter(
+        FoodPost.title.contains(search_term) |
+        FoodPost.description.contains(search_term)
+    )
+    return query, None
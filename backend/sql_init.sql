@@ -21,6 +21,7 @@ CREATE TABLE users (
     bio TEXT,
     is_active BOOLEAN DEFAULT TRUE,
     is_admin BOOLEAN DEFAULT FALSE,
+    unread_message_count INT NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
@@ -44,17 +45,33 @@ CREATE TABLE food_posts (
     quantity VARCHAR(100),
     expiry_date DATE,
     pickup_location TEXT NOT NULL,
+    latitude DOUBLE NULL,
+    longitude DOUBLE NULL,
+    geohash VARCHAR(12) NULL,
     pickup_time_start TIME,
     pickup_time_end TIME,
     is_available BOOLEAN DEFAULT TRUE,
     is_claimed BOOLEAN DEFAULT FALSE,
     claimed_by INT NULL,
     claimed_at TIMESTAMP NULL,
+    claim_expires_at TIMESTAMP NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL,
-    FOREIGN KEY (claimed_by) REFERENCES users(id) ON DELETE SET NULL
+    FOREIGN KEY (claimed_by) REFERENCES users(id) ON DELETE SET NULL,
+    FULLTEXT INDEX ft_food_posts_title_description (title, description)
+);
+
+-- First-come, first-served queue for claimed posts
+CREATE TABLE claim_waitlist (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    food_post_id INT NOT NULL,
+    user_id INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_claim_waitlist_post_user (food_post_id, user_id),
+    FOREIGN KEY (food_post_id) REFERENCES food_posts(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
 -- Food post images table
@@ -62,24 +79,60 @@ CREATE TABLE food_images (
     id INT PRIMARY KEY AUTO_INCREMENT,
     food_post_id INT NOT NULL,
     image_path VARCHAR(255) NOT NULL,
+    card_path VARCHAR(255) NULL,
+    thumb_path VARCHAR(255) NULL,
+    content_hash CHAR(64) NULL,
     is_primary BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (food_post_id) REFERENCES food_posts(id) ON DELETE CASCADE
 );
 
+-- Message threads between two users, optionally about one food post.
+-- post_key is food_post_id, or 0 for general threads, so the unique key covers both.
+CREATE TABLE conversations (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_low_id INT NOT NULL,
+    user_high_id INT NOT NULL,
+    food_post_id INT NULL,
+    post_key INT NOT NULL DEFAULT 0,
+    last_message_id INT NULL,
+    last_message_at TIMESTAMP NULL,
+    last_message_preview VARCHAR(200) NULL,
+    last_sender_id INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_conversations_pair_post (user_low_id, user_high_id, post_key),
+    FOREIGN KEY (user_low_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_high_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (food_post_id) REFERENCES food_posts(id) ON DELETE SET NULL
+);
+
+-- Each user's side of a conversation: unread count and inbox sort key
+CREATE TABLE conversation_participants (
+    conversation_id INT NOT NULL,
+    user_id INT NOT NULL,
+    unread_count INT NOT NULL DEFAULT 0,
+    last_message_at TIMESTAMP NULL,
+    last_read_at TIMESTAMP NULL,
+    PRIMARY KEY (conversation_id, user_id),
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
 -- Messages table for communication between users
 CREATE TABLE messages (
     id INT PRIMARY KEY AUTO_INCREMENT,
     sender_id INT NOT NULL,
     receiver_id INT NOT NULL,
     food_post_id INT,
+    conversation_id INT NULL,
     subject VARCHAR(200),
     message TEXT NOT NULL,
     is_read BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (sender_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE,
-    FOREIGN KEY (food_post_id) REFERENCES food_posts(id) ON DELETE SET NULL
+    FOREIGN KEY (food_post_id) REFERENCES food_posts(id) ON DELETE SET NULL,
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
 );
 
 -- Reviews/ratings table
@@ -97,6 +150,20 @@ CREATE TABLE reviews (
     UNIQUE KEY unique_review (reviewer_id, reviewed_user_id, food_post_id)
 );
 
+-- Running review totals per user, so ratings never aggregate over reviews
+CREATE TABLE user_ratings (
+    user_id INT PRIMARY KEY,
+    rating_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_1_count INT NOT NULL DEFAULT 0,
+    rating_2_count INT NOT NULL DEFAULT 0,
+    rating_3_count INT NOT NULL DEFAULT 0,
+    rating_4_count INT NOT NULL DEFAULT 0,
+    rating_5_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
 -- Insert default categories
 INSERT INTO categories (name, description, icon) VALUES
 ('Fruits', 'Fresh fruits and berries', '🍎'),
@@ -112,9 +179,26 @@ INSERT INTO categories (name, description, icon) VALUES
 
 -- Create indexes for better performance
 CREATE INDEX idx_food_posts_user_id ON food_posts(user_id);
-CREATE INDEX idx_food_posts_category_id ON food_posts(category_id);
-CREATE INDEX idx_food_posts_is_available ON food_posts(is_available);
-CREATE INDEX idx_food_posts_created_at ON food_posts(created_at);
+CREATE INDEX idx_food_posts_created_at_id ON food_posts(created_at, id);
+CREATE INDEX idx_food_posts_geohash ON food_posts(geohash);
+
+-- Feed indexes: equality predicates first, then (created_at, id) so the
+-- newest-first ordering is read straight off the index
+CREATE INDEX idx_food_posts_available_created ON food_posts(is_available, created_at, id);
+CREATE INDEX idx_food_posts_available_claimed_created ON food_posts(is_available, is_claimed, created_at, id);
+CREATE INDEX idx_food_posts_category_available_created ON food_posts(category_id, is_available, created_at, id);
+CREATE INDEX idx_users_state_city ON users(state, city);
+CREATE INDEX idx_users_city ON users(city);
+CREATE INDEX idx_food_posts_claim_expires ON food_posts(is_claimed, claim_expires_at);
+CREATE INDEX idx_food_posts_available_expiry ON food_posts(is_available, expiry_date);
+CREATE INDEX idx_claim_waitlist_post_queue ON claim_waitlist(food_post_id, created_at, id);
+
+CREATE INDEX idx_food_images_post_primary ON food_images(food_post_id, is_primary);
+CREATE INDEX idx_food_images_content_hash ON food_images(content_hash);
 CREATE INDEX idx_messages_sender_id ON messages(sender_id);
 CREATE INDEX idx_messages_receiver_id ON messages(receiver_id);
+CREATE INDEX idx_messages_conversation_created ON messages(conversation_id, created_at, id);
+CREATE INDEX idx_messages_conversation_unread ON messages(conversation_id, receiver_id, is_read);
+CREATE INDEX idx_conversation_participants_inbox ON conversation_participants(user_id, last_message_at, conversation_id);
 CREATE INDEX idx_reviews_reviewed_user_id ON reviews(reviewed_user_id);
+CREATE INDEX idx_reviews_reviewed_user_created ON reviews(reviewed_user_id, created_at, id);
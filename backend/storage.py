@@ -0,0 +1,256 @@
+"""
+Storage backends for uploaded files.
+
+Files are addressed by keys such as "uploads/<hash>_card.webp", which is also
+what FoodImage rows store. LocalStorage keeps them on disk under a root
+directory, served by the /uploads static mount. S3Storage keeps them in an
+S3-compatible bucket (AWS S3, MinIO, ...) and hands out presigned or public
+URLs, so image bytes never pass through the API and replicas don't need a
+shared volume.
+
+STORAGE_BACKEND picks the backend ("local" by default, or "s3").
+"""
+
+import os
+import re
+import uuid
+import shutil
+import logging
+import mimetypes
+from collections import namedtuple
+from typing import BinaryIO, Iterator, Optional, Union
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", ".")
+
+S3_BUCKET = os.getenv("S3_BUCKET", "foodshare")
+# Point at MinIO or another S3-compatible server; unset means AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+# Falls back to the usual AWS credential chain when unset
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID") or None
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY") or None
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "3600"))
+# Base URL of a public bucket or CDN in front of it; when set, URLs are not signed
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", "").rstrip("/")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Files named after the sha256 of their upload ("<hash>.jpg", "<hash>_card.webp")
+# never change
+CONTENT_ADDRESSED_NAME = re.compile(r"^([0-9a-f]{64})[_.]")
+
+StoredFile = namedtuple("StoredFile", ["key", "size", "modified"])
+
+class Storage:
+    """Interface every storage backend implements."""
+
+    def save(self, key: str, source: Union[bytes, BinaryIO]) -> None:
+        """Store bytes or a file object under key, replacing it atomically."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def touch(self, key: str) -> bool:
+        """Reset key's modification time, so the orphan GC treats it as new.
+
+        Returns False if it does not exist.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        """Remove key. Returns False if it did not exist."""
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        """URL clients can fetch the file from."""
+        raise NotImplementedError
+
+    def iter_files(self, prefix: str) -> Iterator[StoredFile]:
+        """Yield every file whose key starts with prefix, without listing them all up front."""
+        raise NotImplementedError
+
+class LocalStorage(Storage):
+    """Files on the local disk, keyed by their path relative to root."""
+
+    def __init__(self, root: str = ".", base_url: str = "/"):
+        self.root = root
+        self.base_url = base_url
+
+    def path(self, key: str) -> str:
+        parts = key.split("/")
+        if not key or key.startswith("/") or ".." in parts:
+            raise ValueError(f"Invalid storage key: {key}")
+        return os.path.join(self.root, *parts)
+
+    def save(self, key: str, source: Union[bytes, BinaryIO]) -> None:
+        file_path = self.path(key)
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        # Write beside the target and rename, so readers never see a partial file
+        temp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as buffer:
+                if isinstance(source, bytes):
+                    buffer.write(source)
+                else:
+                    source.seek(0)
+                    shutil.copyfileobj(source, buffer, 64 * 1024)
+            os.replace(temp_path, file_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def touch(self, key: str) -> bool:
+        try:
+            os.utime(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self.path(key))
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}{key}"
+
+    def iter_files(self, prefix: str) -> Iterator[StoredFile]:
+        directory = prefix.rstrip("/")
+        try:
+            entries = os.scandir(self.path(directory))
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield StoredFile(f"{directory}/{entry.name}", stat.st_size, stat.st_mtime)
+
+class S3Storage(Storage):
+    """Objects in an S3-compatible bucket, keyed by object key."""
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        presign_expires: int = 3600,
+        public_url: str = "",
+    ):
+        import boto3
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        self.bucket = bucket
+        self.presign_expires = presign_expires
+        self.public_url = public_url
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            # Path-style addressing is what MinIO and most stand-ins expect
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+        )
+        # A presigned URL changes every time it is signed; reusing it for half
+        # its lifetime keeps browser and CDN caches warm
+        self._url_cache = TTLCache(ttl=presign_expires / 2, maxsize=10000)
+
+    def save(self, key: str, source: Union[bytes, BinaryIO]) -> None:
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        extra_args = {"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL}
+        if isinstance(source, bytes):
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=source, **extra_args)
+        else:
+            source.seek(0)
+            self.client.upload_fileobj(source, self.bucket, key, ExtraArgs=extra_args)
+
+    def _head(self, key: str) -> Optional[dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def touch(self, key: str) -> bool:
+        if not self.exists(key):
+            return False
+        # Copying an object onto itself is how S3 updates LastModified
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        self.client.copy_object(
+            Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+            MetadataDirective="REPLACE", ContentType=content_type, CacheControl=IMMUTABLE_CACHE_CONTROL
+        )
+        return True
+
+    def delete(self, key: str) -> bool:
+        if not self.exists(key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        self._url_cache.delete("url", key)
+        return True
+
+    def size(self, key: str) -> int:
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head["ContentLength"]
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+        return self._url_cache.get_or_load("url", key, lambda: self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.presign_expires,
+        ))
+
+    def iter_files(self, prefix: str) -> Iterator[StoredFile]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix.rstrip("/") + "/"):
+            for obj in page.get("Contents", []):
+                yield StoredFile(obj["Key"], obj["Size"], obj["LastModified"].timestamp())
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """Build the storage backend named by STORAGE_BACKEND."""
+    if backend == "local":
+        return LocalStorage(LOCAL_STORAGE_ROOT)
+    if backend == "s3":
+        logger.info(f"Using S3 storage: bucket={S3_BUCKET} endpoint={S3_ENDPOINT_URL or 'aws'}")
+        return S3Storage(
+            S3_BUCKET,
+            endpoint_url=S3_ENDPOINT_URL,
+            region=S3_REGION,
+            access_key_id=S3_ACCESS_KEY_ID,
+            secret_access_key=S3_SECRET_ACCESS_KEY,
+            presign_expires=S3_PRESIGN_EXPIRES,
+            public_url=S3_PUBLIC_URL,
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+storage = create_storage()
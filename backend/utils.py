@@ -1,32 +1,94 @@
 import os
-import uuid
+import time
+import base64
+import hashlib
 import logging
-from typing import List, Optional
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from fastapi import UploadFile, HTTPException
+from sqlalchemy import func, insert, or_
 from sqlalchemy.orm import Session
 from models import FoodImage, FoodPost
+from images import render_variants, InvalidImageError, IMAGE_VARIANTS, VARIANT_EXTENSION
+from storage import storage, CONTENT_ADDRESSED_NAME
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def save_uploaded_file(file: UploadFile, upload_dir: str = "uploads") -> str:
-    """Save an uploaded file and return the file path."""
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Threads that resize and store a post's images side by side; Pillow and file
+# or S3 I/O release the GIL for most of that work
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+# Leading bytes of each accepted image format -> canonical extension
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds its size limit while being written."""
+
+def sniff_image_type(file_obj) -> Optional[str]:
+    """Identify an image from its magic bytes. Returns its extension or None."""
+    file_obj.seek(0)
+    header = file_obj.read(12)
+    file_obj.seek(0)
+    
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    return None
+
+def hash_file(file_obj, max_size: Optional[int] = None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """Return the sha256 hex digest of a file object, read in chunks.
+
+    Only one chunk is held in memory at a time. Raises UploadTooLargeError as
+    soon as more than max_size bytes have been read.
+    """
+    hasher = hashlib.sha256()
+    read = 0
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+        read += len(chunk)
+        if max_size is not None and read > max_size:
+            raise UploadTooLargeError(f"Upload exceeds {format_file_size(max_size)}")
+        hasher.update(chunk)
+    file_obj.seek(0)
+    return hasher.hexdigest()
+
+def storage_key(upload_dir: str, filename: str) -> str:
+    """Storage key for a file in an upload directory, e.g. "uploads/<name>"."""
+    return f"{upload_dir.rstrip('/')}/{filename}"
+
+def save_uploaded_file(file: UploadFile, upload_dir: str = "uploads", max_size: int = MAX_IMAGE_SIZE) -> str:
+    """Save an uploaded file and return its storage key."""
     try:
-        # Create upload directory if it doesn't exist
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Generate unique filename
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(upload_dir, unique_filename)
+        # Trust the content over the client's name for the extension
+        file_extension = sniff_image_type(file.file) or os.path.splitext(file.filename)[1]
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
-        
-        logger.info(f"File saved successfully: {file_path}")
+        # Store under the content hash so identical uploads share one file
+        file_path = storage_key(upload_dir, f"{hash_file(file.file, max_size)}{file_extension}")
+        # touch() also restarts the orphan GC's min-age clock for the reused file
+        if storage.touch(file_path):
+            logger.info(f"File already stored, reusing: {file_path}")
+        else:
+            storage.save(file_path, file.file)
+            logger.info(f"File saved successfully: {file_path}")
         return file_path
+    except UploadTooLargeError as e:
+        logger.warning(f"Rejected upload {file.filename}: {str(e)}")
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {format_file_size(max_size)}.")
     except OSError as e:
         logger.error(f"Failed to save file {file.filename}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
@@ -35,10 +97,9 @@ def save_uploaded_file(file: UploadFile, upload_dir: str = "uploads") -> str:
         raise HTTPException(status_code=500, detail="Failed to save file")
 
 def delete_file(file_path: str) -> bool:
-    """Delete a file from the filesystem."""
+    """Delete a file from storage."""
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if storage.delete(file_path):
             logger.info(f"File deleted successfully: {file_path}")
             return True
         logger.warning(f"File not found for deletion: {file_path}")
@@ -50,58 +111,184 @@ def delete_file(file_path: str) -> bool:
         logger.error(f"Unexpected error deleting file {file_path}: {str(e)}")
         return False
 
-def save_food_images(db: Session, food_post_id: int, images: List[UploadFile], upload_dir: str = "uploads") -> List[FoodImage]:
-    """Save multiple food images and create database records."""
-    saved_images = []
+def save_image_variants(file: UploadFile, upload_dir: str = "uploads") -> Tuple[str, dict]:
+    """Render an uploaded image into its resized variants and write them to storage.
+
+    Files are named after the sha256 of the upload, so posting the same photo
+    again reuses the stored variants without decoding it. Reused variants are
+    touched, so gc_uploads.py's min-age keeps them until the new row commits.
+    Returns (content hash, {variant: file path}).
+    """
+    content_hash = hash_file(file.file)
+    paths = {
+        name: storage_key(upload_dir, f"{content_hash}_{name}{VARIANT_EXTENSION}")
+        for name in IMAGE_VARIANTS
+    }
+    
+    if all(storage.touch(file_path) for file_path in paths.values()):
+        logger.info(f"Image already stored, reusing variants: {content_hash}")
+        return content_hash, paths
     
+    variants = render_variants(file.file)
+    written = []
     try:
-        for i, image in enumerate(images):
-            file_path = save_uploaded_file(image, upload_dir)
-            
-            db_image = FoodImage(
-                food_post_id=food_post_id,
-                image_path=file_path,
-                is_primary=(i == 0)  # First image is primary
-            )
-            db.add(db_image)
-            saved_images.append(db_image)
-        
+        for name, (content, extension) in variants.items():
+            storage.save(paths[name], content)
+            written.append(paths[name])
+    except Exception:
+        for file_path in written:
+            delete_file(file_path)
+        raise
+    
+    logger.info(f"Image variants saved successfully: {content_hash} ({', '.join(paths)})")
+    return content_hash, paths
+
+def get_image_paths(image: FoodImage) -> List[str]:
+    """Return every file written for a food image, across all variants."""
+    return [path for path in (image.image_path, image.card_path, image.thumb_path) if path]
+
+def release_image_files(images: List[FoodImage]) -> int:
+    """Delete the files of images that own them outright.
+
+    Images without a content hash predate deduplication and their files are
+    deleted here. Content-addressed files may be shared, or about to be shared
+    by a post whose row isn't committed yet, so they are never unlinked inline;
+    gc_uploads.py removes them once no row references them and they are older
+    than its min-age. Returns the number of files deleted.
+    """
+    owned = {file_path for image in images if not image.content_hash for file_path in get_image_paths(image)}
+    return sum(1 for file_path in owned if delete_file(file_path))
+
+def image_rows(stored: List[Tuple[str, dict]]) -> List[dict]:
+    """Column values for the FoodImage rows of stored images; the first is primary."""
+    return [
+        {
+            "image_path": paths["full"],
+            "card_path": paths["card"],
+            "thumb_path": paths["thumb"],
+            "content_hash": content_hash,
+            "is_primary": i == 0,
+        }
+        for i, (content_hash, paths) in enumerate(stored)
+    ]
+
+def store_images(images: List[UploadFile], upload_dir: str = "uploads") -> List[Tuple[str, dict]]:
+    """Render and store several uploads concurrently.
+
+    Returns (content hash, {variant: path}) for each image, in order. If any
+    image fails, the first error is re-raised once the others have finished;
+    files already stored for them are left to gc_uploads.py.
+    """
+    futures = [image_executor.submit(save_image_variants, image, upload_dir) for image in images]
+    stored = []
+    error = None
+    for future in futures:
+        try:
+            stored.append(future.result())
+        except Exception as e:
+            error = error or e
+    
+    if error is not None:
+        raise error
+    return stored
+
+def save_food_post_with_images(db: Session, food_post: FoodPost, images: List[UploadFile], upload_dir: str = "uploads") -> FoodPost:
+    """Store a new food post's images, then insert the post and its image rows in one transaction.
+
+    The files are written first, in parallel and outside the transaction, so
+    no database connection is held while images are encoded. The image rows
+    go in with a single bulk INSERT. If the transaction fails, the files are
+    left for gc_uploads.py, as another post may be reusing them.
+    """
+    try:
+        stored = store_images(images, upload_dir)
+    except InvalidImageError as e:
+        logger.warning(f"Rejected invalid image for new food post: {str(e)}")
+        raise HTTPException(status_code=400, detail="Invalid image file. The upload could not be read as an image.")
+    except Exception as e:
+        logger.error(f"Failed to store images for new food post: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to save images")
+    
+    rows = image_rows(stored)
+    try:
+        db.add(food_post)
+        db.flush()
+        if rows:
+            db.execute(insert(FoodImage), [dict(row, food_post_id=food_post.id) for row in rows])
         db.commit()
-        logger.info(f"Saved {len(saved_images)} images for food post {food_post_id}")
-        return saved_images
     except Exception as e:
         db.rollback()
-        logger.error(f"Failed to save images for food post {food_post_id}: {str(e)}")
-        # Clean up any files that were saved before the error
-        for image in saved_images:
-            delete_file(image.image_path)
-        raise HTTPException(status_code=500, detail="Failed to save images")
+        logger.error(f"Failed to save food post with {len(rows)} images: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to save food post")
+    
+    logger.info(f"Saved food post {food_post.id} with {len(rows)} images")
+    return food_post
 
 def delete_food_images(db: Session, food_post_id: int) -> bool:
-    """Delete all images associated with a food post."""
+    """Delete all images associated with a food post.
+
+    Content-addressed files may be shared with other posts, so only files
+    owned by pre-deduplication images are unlinked here; gc_uploads.py
+    removes the rest once nothing references them.
+    """
     try:
         images = db.query(FoodImage).filter(FoodImage.food_post_id == food_post_id).all()
-        deleted_count = 0
         
         for image in images:
-            if delete_file(image.image_path):
-                deleted_count += 1
             db.delete(image)
         
         db.commit()
-        logger.info(f"Deleted {deleted_count}/{len(images)} images for food post {food_post_id}")
+        deleted_count = release_image_files(images)
+        logger.info(f"Deleted {len(images)} images for food post {food_post_id} ({deleted_count} files unlinked)")
         return True
     except Exception as e:
         db.rollback()
         logger.error(f"Failed to delete images for food post {food_post_id}: {str(e)}")
         return False
 
-def get_primary_image(food_post: FoodPost) -> FoodImage:
-    """Get the primary image for a food post."""
-    primary_image = next((img for img in food_post.images if img.is_primary), None)
-    if not primary_image and food_post.images:
-        primary_image = food_post.images[0]
-    return primary_image
+def get_primary_images(db: Session, food_post_ids: List[int], columns: Optional[list] = None) -> Dict[int, FoodImage]:
+    """Get the primary image for each of several food posts in one batched query.
+
+    Posts without an image flagged as primary fall back to their first
+    image, which costs one extra query only when needed.
+    Pass columns (including id and food_post_id) to get plain rows instead
+    of FoodImage objects.
+    """
+    if not food_post_ids:
+        return {}
+    
+    selected = columns or [FoodImage]
+    primary_images = {}
+    for image in db.query(*selected).filter(
+        FoodImage.food_post_id.in_(food_post_ids),
+        FoodImage.is_primary == True
+    ).order_by(FoodImage.id):
+        primary_images.setdefault(image.food_post_id, image)
+    
+    missing_ids = [post_id for post_id in food_post_ids if post_id not in primary_images]
+    if missing_ids:
+        first_image_ids = db.query(func.min(FoodImage.id)).filter(
+            FoodImage.food_post_id.in_(missing_ids)
+        ).group_by(FoodImage.food_post_id)
+        for image in db.query(*selected).filter(FoodImage.id.in_(first_image_ids)):
+            primary_images[image.food_post_id] = image
+    
+    return primary_images
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    """Encode a (created_at, id) position as an opaque pagination cursor."""
+    raw = f"{created_at.isoformat()}|{post_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor. Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, post_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
 
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human readable format."""
@@ -117,49 +304,91 @@ def format_file_size(size_bytes: int) -> str:
     return f"{size_bytes:.1f} {size_names[i]}"
 
 def validate_image_file(file: UploadFile) -> bool:
-    """Validate that the uploaded file is an image."""
-    allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    
-    if file_extension not in allowed_extensions:
+    """Validate that the uploaded file is an image, judged by its content."""
+    if sniff_image_type(file.file) is None:
         return False
     
-    # Check file size (max 10MB)
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    if file_size > 10 * 1024 * 1024:  # 10MB
+    # The multipart parser counts bytes as they arrive, so no seek is needed
+    if file.size is not None and file.size > MAX_IMAGE_SIZE:
         return False
     
     return True
 
-def clean_old_files(upload_dir: str = "uploads", days_old: int = 30) -> int:
-    """Clean up old uploaded files that are no longer referenced."""
-    import time
-    from datetime import datetime, timedelta
+def find_referenced_files(db: Session, keys: List[str]) -> set:
+    """Return the subset of storage keys that some FoodImage row points at.
+
+    Content-addressed names are resolved through the indexed content_hash
+    column; only older, uuid-named files fall back to matching the path
+    columns directly.
+    """
+    hashes = set()
+    legacy_keys = []
+    for key in keys:
+        match = CONTENT_ADDRESSED_NAME.match(posixpath.basename(key))
+        if match:
+            hashes.add(match.group(1))
+        else:
+            legacy_keys.append(key)
+    
+    path_columns = (FoodImage.image_path, FoodImage.card_path, FoodImage.thumb_path)
+    referenced = set()
+    if hashes:
+        for row in db.query(*path_columns).filter(FoodImage.content_hash.in_(hashes)):
+            referenced.update(row)
+    if legacy_keys:
+        for row in db.query(*path_columns).filter(or_(*[column.in_(legacy_keys) for column in path_columns])):
+            referenced.update(row)
+    return referenced.intersection(keys)
+
+def collect_orphan_files(
+    db: Session,
+    upload_dir: str = "uploads",
+    min_age_hours: float = 24,
+    dry_run: bool = False,
+    max_deletes_per_second: float = 0,
+    batch_size: int = 1000
+) -> dict:
+    """Delete uploaded files that no FoodImage row references.
+
+    The upload directory is streamed and checked against the database one
+    batch at a time, so memory stays bounded by batch_size however many files
+    there are. Files younger than min_age_hours are skipped, which covers
+    uploads whose rows are not committed yet. With dry_run nothing is
+    deleted, and max_deletes_per_second (0 for no limit) paces deletions to
+    spare the disk or the bucket's request quota.
+    """
+    cutoff_time = time.time() - min_age_hours * 3600
+    delete_interval = 1 / max_deletes_per_second if max_deletes_per_second > 0 else 0
+    stats = {"scanned": 0, "orphans": 0, "deleted": 0, "bytes": 0, "dry_run": dry_run}
     
-    cutoff_time = time.time() - (days_old * 24 * 60 * 60)
-    deleted_count = 0
+    files = storage.iter_files(upload_dir)
+    while True:
+        batch = list(islice(files, batch_size))
+        if not batch:
+            break
+        stats["scanned"] += len(batch)
+        
+        candidates = [stored_file for stored_file in batch if stored_file.modified < cutoff_time]
+        if not candidates:
+            continue
+        referenced = find_referenced_files(db, [stored_file.key for stored_file in candidates])
+        db.rollback()  # end the read transaction so each batch sees fresh rows
+        
+        for stored_file in candidates:
+            if stored_file.key in referenced:
+                continue
+            stats["orphans"] += 1
+            stats["bytes"] += stored_file.size
+            if dry_run:
+                logger.info(f"Orphaned file (dry run): {stored_file.key}")
+                continue
+            if delete_file(stored_file.key):
+                stats["deleted"] += 1
+            if delete_interval:
+                time.sleep(delete_interval)
     
-    try:
-        if not os.path.exists(upload_dir):
-            logger.warning(f"Upload directory does not exist: {upload_dir}")
-            return 0
-            
-        for filename in os.listdir(upload_dir):
-            file_path = os.path.join(upload_dir, filename)
-            if os.path.isfile(file_path):
-                file_time = os.path.getmtime(file_path)
-                if file_time < cutoff_time:
-                    if delete_file(file_path):
-                        deleted_count += 1
-                        
-        logger.info(f"Cleaned up {deleted_count} old files from {upload_dir}")
-        return deleted_count
-    except OSError as e:
-        logger.error(f"Failed to clean old files from {upload_dir}: {str(e)}")
-        return 0
-    except Exception as e:
-        logger.error(f"Unexpected error cleaning old files: {str(e)}")
-        return 0
+    logger.info(
+        f"Orphan scan of {upload_dir}: {stats['scanned']} files, {stats['orphans']} orphans "
+        f"({format_file_size(stats['bytes'])}), {stats['deleted']} deleted"
+    )
+    return stats
@@ -277,10 +277,12 @@ function displayFoodPosts(posts) {
         <div class="food-card" onclick="showFoodDetail(${post.id})">
             <img src="${
               post.primary_image
-                ? `${API_BASE_URL}/${post.primary_image.image_path}`
+                ? imageSrc(
+                    post.primary_image.card_url || post.primary_image.image_url
+                  )
                 : "/placeholder-food.jpg"
             }" 
-                 alt="${post.title}" class="food-card-image">
+                 alt="${post.title}" class="food-card-image" loading="lazy">
             <div class="food-card-content">
                 <h3 class="food-card-title">${post.title}</h3>
                 <p class="food-card-description">${post.description}</p>
@@ -326,7 +328,7 @@ function displayFoodDetailModal(post) {
   content.innerHTML = `
         ${
           primaryImage
-            ? `<img src="${API_BASE_URL}/${primaryImage.image_path}" alt="${post.title}" class="food-detail-image">`
+            ? `<img src="${imageSrc(primaryImage.image_url)}" alt="${post.title}" class="food-detail-image">`
             : ""
         }
         
@@ -576,6 +578,11 @@ function showToast(message, type = "success") {
   }, 3000);
 }
 
+function imageSrc(url) {
+  // Local storage returns paths on the API; S3 returns absolute (presigned) URLs
+  return /^https?:\/\//.test(url) ? url : `${API_BASE_URL}${url}`;
+}
+
 function formatDate(dateString) {
   const date = new Date(dateString);
   return date.toLocaleDateString("en-US", {
@@ -1,6 +1,17 @@
 #!/usr/bin/env python3
+import os
+import sys
+import asyncio
+import base64
+import uuid
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+# 1x1 PNG, enough for a food post image
+TINY_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGP4z8AAAAMBAQDJ/pLvAAAAAElFTkSuQmCC"
+)
 
 def test_backend():
     base_url = "http://localhost:8000"
@@ -41,5 +52,135 @@ def test_backend():
     
     print("=" * 40)
 
+def login(base_url, username, password):
+    response = requests.post(f"{base_url}/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def check_concurrent_claims(base_url="http://localhost:8000", claimers=20):
+    """Fire parallel claims at one post and check that exactly one wins."""
+    print(f"🧪 Testing {claimers} concurrent claims...")
+    try:
+        owner = login(base_url, "testuser", "password123")
+        response = requests.post(
+            f"{base_url}/food-posts",
+            headers=owner,
+            data={"title": "Claim race", "description": "Concurrency check", "pickup_location": "Test"},
+            files=[("images", ("tiny.png", TINY_PNG, "image/png"))]
+        )
+        response.raise_for_status()
+        post_id = response.json()["id"]
+        
+        # Register a separate user per claimer
+        headers = []
+        for _ in range(claimers):
+            username = f"claimer_{uuid.uuid4().hex[:10]}"
+            requests.post(f"{base_url}/register", json={
+                "username": username, "email": f"{username}@example.com", "password": "password123"
+            }).raise_for_status()
+            headers.append(login(base_url, username, "password123"))
+        
+        def claim(user_headers):
+            return requests.post(f"{base_url}/food-posts/{post_id}/claim", headers=user_headers).status_code
+        
+        with ThreadPoolExecutor(max_workers=claimers) as executor:
+            statuses = list(executor.map(claim, headers))
+        
+        winners = statuses.count(200)
+        losers = statuses.count(404)
+        if winners == 1 and losers == claimers - 1:
+            print(f"✅ Exactly one winner, {losers} claimers got 404")
+        else:
+            print(f"❌ Expected one winner, got statuses {sorted(statuses)}")
+        
+        own_claim = requests.post(f"{base_url}/food-posts/{post_id}/claim", headers=owner).status_code
+        print(f"{'✅' if own_claim == 404 else '❌'} Claiming an already claimed post: {own_claim}")
+    except Exception as e:
+        print(f"❌ Concurrent claim check error: {e}")
+
+def check_s3_storage(endpoint_url, bucket="foodshare-test"):
+    """Run S3Storage save/url/delete against an S3 stand-in such as MinIO or moto_server."""
+    print(f"🧪 Testing S3 storage against {endpoint_url}...")
+    try:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+        from storage import S3Storage
+        
+        store = S3Storage(
+            bucket,
+            endpoint_url=endpoint_url,
+            region=os.getenv("S3_REGION", "us-east-1"),
+            access_key_id=os.getenv("S3_ACCESS_KEY_ID", "minioadmin"),
+            secret_access_key=os.getenv("S3_SECRET_ACCESS_KEY", "minioadmin"),
+            presign_expires=60
+        )
+        try:
+            store.client.head_bucket(Bucket=bucket)
+        except store._client_error:
+            store.client.create_bucket(Bucket=bucket)
+        
+        key = f"uploads/check_{uuid.uuid4().hex}.png"
+        store.save(key, TINY_PNG)
+        print(f"{'✅' if store.exists(key) and store.size(key) == len(TINY_PNG) else '❌'} Saved {key}")
+        
+        response = requests.get(store.url(key))
+        served = response.status_code == 200 and response.content == TINY_PNG
+        print(f"{'✅' if served else '❌'} Presigned URL: {response.status_code}, {response.headers.get('Content-Type')}")
+        
+        deleted = store.delete(key) and not store.exists(key) and not store.delete(key)
+        print(f"{'✅' if deleted else '❌'} Deleted {key}")
+    except Exception as e:
+        print(f"❌ S3 storage check error: {e}")
+
+def check_redis_broker(redis_url=None):
+    """Check that an event published through one RedisBroker reaches every subscribed broker.
+    
+    Two brokers stand in for two workers. Without redis_url they share an
+    in-process fakeredis server.
+    """
+    if not redis_url:
+        try:
+            import fakeredis
+        except ImportError:
+            print("⏭️  Skipping Redis broker check: set REDIS_URL or pip install fakeredis")
+            return
+    print(f"🧪 Testing Redis realtime broker against {redis_url or 'fakeredis'}...")
+    
+    async def run():
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+        from realtime import RedisBroker
+        
+        if redis_url:
+            import redis.asyncio as redis
+            clients = [redis.from_url(redis_url), redis.from_url(redis_url)]
+        else:
+            server = fakeredis.FakeServer()
+            clients = [fakeredis.FakeAsyncRedis(server=server), fakeredis.FakeAsyncRedis(server=server)]
+        
+        channel = f"foodshare:check:{uuid.uuid4().hex}"
+        brokers = [RedisBroker(channel=channel, client=client) for client in clients]
+        received = [asyncio.Queue() for _ in brokers]
+        for broker, queue in zip(brokers, received):
+            await broker.start(queue.put)
+        try:
+            envelope = {"user_ids": [1, 2], "event": {"type": "check", "data": {"n": 1}}}
+            await brokers[0].publish(envelope)
+            return [await asyncio.wait_for(queue.get(), timeout=5) for queue in received], envelope
+        finally:
+            for broker in brokers:
+                await broker.stop()
+    
+    try:
+        deliveries, envelope = asyncio.run(run())
+        ok = all(delivery == envelope for delivery in deliveries)
+        print(f"{'✅' if ok else '❌'} Event delivered to {len(deliveries)} brokers")
+    except Exception as e:
+        print(f"❌ Redis broker check error: {e!r}")
+
 if __name__ == "__main__":
     test_backend()
+    check_concurrent_claims()
+    # Needs an S3 stand-in, e.g. docker run -p 9000:9000 minio/minio server /data
+    if os.getenv("S3_ENDPOINT_URL"):
+        check_s3_storage(os.getenv("S3_ENDPOINT_URL"))
+    # Uses fakeredis unless REDIS_URL points at a Redis server
+    check_redis_broker(os.getenv("REDIS_URL"))